@@ -4,30 +4,98 @@
 #   "fastapi",
 #   "uvicorn",
 #   "requests",
+#   "httpx",
 #   "scikit-learn",
 #   "beautifulsoup4",
 #   "transcribe",
 #   "markdown",
+#   "numpy",
+#   "watchfiles",
+#   "pillow",
 # ]
 # ///
 
-import requests
+import startup
 import uvicorn
 import os
+import asyncio
+import logging
+import time
 import urllib.parse
-from bs4 import BeautifulSoup
-import transcribe
-import markdown
 import json
-import subprocess
-import sqlite3
-from datetime import datetime
 import re
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
-
-app = FastAPI()
+from code_cache import CodeCache
+import http_client
+import executor
+import script_runner
+import file_server
+from jobs import JobScheduler, QueueFull
+from batch import run_batch, task_data_paths
+import prompt_router
+import handlers
+import metrics
+import query_engine
+import data_index
+import media
+from data_paths import data_file_path, get_data_dir
+
+startup.mark("imports")
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("app")
+
+# Always add a Server-Timing header; otherwise only when the request sends "X-Timing: 1".
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    http_client.get_client()
+    await executor.start()
+    await script_runner.ensure_uv()
+    await job_scheduler.start()
+    if data_index.ENABLED:
+        await data_index.start()
+    startup.mark("ready")
+    # Heavy modules (scikit-learn, numpy) are otherwise imported by the first task that needs them.
+    warmup = asyncio.create_task(startup.warm_up(warmup_steps())) if startup.WARMUP else None
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    await job_scheduler.stop()
+    await data_index.stop()
+    media.shutdown()
+    executor.shutdown()
+    await http_client.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    spans = []
+    token = metrics.request_spans.set(spans)
+    metrics.http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.http_in_flight.dec()
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_requests.inc(request.method, route, str(status))
+        metrics.http_seconds.observe(elapsed, request.method, route)
+        metrics.request_spans.reset(token)
+        startup.mark("first_response")
+    if TIMING_HEADER or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = metrics.server_timing(spans + [("total", elapsed)])
+    return response
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,6 +109,26 @@ AIPROXY_TOKEN = os.getenv("AIPROXY_TOKEN")
 if not AIPROXY_TOKEN:
     raise RuntimeError("AIPROXY_TOKEN environment variable not set.")
 
+# Overridable so benchmarks can point the app at a local OpenAI-compatible stand-in.
+LLM_URL = os.getenv("LLM_URL", "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions")
+
+code_cache = CodeCache(
+    os.getenv("CODE_CACHE_DB", os.path.join(".cache", "code_cache.sqlite3")),
+    max_memory_entries=int(os.getenv("CODE_CACHE_MEMORY_ENTRIES", "256")),
+    max_disk_entries=int(os.getenv("CODE_CACHE_DISK_ENTRIES", "5000")),
+    ttl=float(os.getenv("CODE_CACHE_TTL", str(7 * 24 * 3600))),
+)
+
+BATCH_MAX_TASKS = int(os.getenv("BATCH_MAX_TASKS", "200"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+job_scheduler = JobScheduler(
+    lambda task, report: run_task(task, report),
+    workers={"llm": int(os.getenv("JOB_WORKERS_LLM", "8")), "script": int(os.getenv("JOB_WORKERS_SCRIPT", "2"))},
+    max_depth={"llm": int(os.getenv("JOB_QUEUE_DEPTH_LLM", "100")), "script": int(os.getenv("JOB_QUEUE_DEPTH_SCRIPT", "20"))},
+    db_path=os.getenv("JOBS_DB"),
+)
+
 tools = [
     {
         "type": "function",
@@ -66,47 +154,29 @@ tools = [
     }
 ]
 
-def execute_python_code(code: str, task_description: str):
-    """Safely execute generated Python code."""
+async def execute_python_code(code: str, task_description: str):
+    """Safely execute generated Python code in a pooled worker process."""
 
     # output_file_path = extract_output_file_path(task_description)
     # print(f"📂 Detected file path: {output_file_path}")
 
-    # cleaned_code = re.sub(r"^```[\w]*\n|```$", "", code, flags=re.MULTILINE).strip()
-    cleaned_code = re.sub(r"^```[\w]*\n|```$", "", code, flags=re.MULTILINE).strip()
-    cleaned_code = cleaned_code.lstrip()
+    with metrics.span("code_cleanup"):
+        cleaned_code = re.sub(r"^```[\w]*\n|```$", "", code, flags=re.MULTILINE).strip()
+        cleaned_code = cleaned_code.lstrip()
 
-    print("Executing Code:\n", cleaned_code)  # Debugging output
-    
-    try:
-        compiled_code = compile(cleaned_code, "<string>", "exec")
-        # compiled_code = compile(cleaned_code, "<string>", "exec")
-        # print("Compiled Code:\n", compiled_code)
-        exec_globals = {"__builtins__": __builtins__, "os": os, "subprocess": subprocess, "sqlite3": sqlite3, "datetime": datetime, "BeautifulSoup": BeautifulSoup, "markdown": markdown}
-        exec_globals["print"] = print  # For debugging output.
-        local_vars = {}
-        exec(compiled_code, exec_globals, local_vars)
-        return {"message": "Execution successful"}
-
-        # if output_file_path:
-        #     # Identify the key that holds the result (assuming it's last defined variable)
-        #     result_var = None
-        #     for key in local_vars:
-        #         if key not in exec_globals:  
-        #             result_var = key
-            
-        #     if result_var:
-        #         result_value = local_vars[result_var]
-        #         with open(output_file_path, "w") as f:
-        #             f.write(str(result_value))
-        #         print(f"✅ Output written to {output_file_path}")
-
-        # return {"message": "Execution successful", "output_file": output_file_path}
-
-    except SyntaxError as e:
-        raise HTTPException(status_code=500, detail=f"Syntax error in generated code: {e}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error executing generated code: {str(e)}")
+    logger.debug("Executing Code:\n%s", cleaned_code)
+
+    result = await executor.run_code(cleaned_code)
+    for stage in ("compile", "exec"):
+        if result[f"{stage}_seconds"] is not None:
+            metrics.observe(stage, result[f"{stage}_seconds"])
+    if not result["ok"]:
+        metrics.stage_errors.inc("compile" if result["error_type"] == "syntax" else "exec")
+    if result["error_type"] == "syntax":
+        raise HTTPException(status_code=500, detail=f"Syntax error in generated code: {result['error']}")
+    if not result["ok"]:
+        raise HTTPException(status_code=500, detail=f"Error executing generated code: {result['error']}")
+    return {"message": "Execution successful", "stdout": result["stdout"], "stderr": result["stderr"]}
 
 def extract_output_file_path(task_description: str):
     """Extracts the expected output file path by looking for keywords like 'write', 'store', etc."""
@@ -120,307 +190,408 @@ def extract_output_file_path(task_description: str):
     
     return match.group(1) if match else None  # Return only the output file path
 
-@app.post("/run")
-async def task_runner(task: str = Query(..., description="Plain-English task description")):
-    print("Received Task:", repr(task))
-    
+async def generate_code(replaced_task: str, routing: dict) -> str:
+    """Ask the LLM for Python code that performs the task, using the routed system prompt."""
+    llm_url = LLM_URL
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {AIPROXY_TOKEN}"
+    }
+    data = {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "user", "content": replaced_task},
+            {"role": "system", "content": routing["prompt"]}
+        ],
+        "max_tokens": 500
+    }
+
+    try:
+        with metrics.span("llm_request"):
+            response = await http_client.request("POST", llm_url, headers=headers, json=data)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"LLM call failed: {e}")
+    if response.status_code != 200:
+        metrics.stage_errors.inc("llm_request")
+        raise HTTPException(status_code=response.status_code, detail="LLM call failed.")
+
+    try:
+        resp_json = response.json()
+        routing["llm_prompt_tokens"] = resp_json.get("usage", {}).get("prompt_tokens")
+        return resp_json['choices'][0]['message']['content']
+    except (KeyError, IndexError, json.JSONDecodeError):
+        raise HTTPException(status_code=500, detail="Unexpected response format from LLM.")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return code_cache.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/query/stats")
+async def query_stats():
+    return query_engine.stats()
+
+@app.get("/router/stats")
+async def router_stats():
+    return prompt_router.stats()
+
+@app.get("/startup")
+async def startup_report():
+    return startup.report()
+
+def warm_embeddings():
+    import embeddings
+    embeddings.get_embedder().embed(["warm up"])
+
+def warmup_steps() -> dict:
+    steps = startup.module_steps()
+    steps["prompt_router"] = prompt_router.get_model
+    steps["embeddings"] = warm_embeddings
+    return steps
+
+SCRIPT_PATTERN = r"https?://[^\s]+\.py"
+
+def task_lane(task: str) -> str:
+    """Jobs that run a downloaded script and jobs that need the LLM are queued separately."""
+    return "script" if re.search(SCRIPT_PATTERN, task) else "llm"
+
+async def prepare_task(task: str, report) -> dict:
     """
-    The LLM (using the script_runner or code_generator tool) extracts the dynamic task parameters.
-    - If the task involves running a script, it downloads and executes it.
-    - Otherwise, the LLM generates Python code dynamically to perform the required operation.
+    Work out how to perform the task without touching /data: the script URL and email
+    argument, a built-in handler, or the Python code to run. Returns a plan for `execute_task`.
     """
-    # Check if task contains a script URL
-    script_pattern = r"https?://[^\s]+\.py"
-    script_match = re.search(script_pattern, task)
+    with metrics.span("route"):
+        # Check if task contains a script URL
+        script_match = re.search(SCRIPT_PATTERN, task)
+        email_match = re.search(r"[\w\.-]+@[\w\.-]+\.\w+", task) if script_match else None
+        # Recurring task families are handled by built-in code without asking the LLM.
+        native = handlers.match(task) if not script_match else None
 
     if script_match:
         # Task involves downloading and executing a script (A1)
         script_url = script_match.group(0)
-        print(script_url)
-        email_match = re.search(r"[\w\.-]+@[\w\.-]+\.\w+", task)
+        logger.debug("Script URL: %s", script_url)
         if not email_match:
             raise HTTPException(status_code=400, detail="Email argument not found in task description.")
         email = email_match.group(0)
-        print(email)
-
+        logger.debug("Script email argument: %s", email)
+        return {"kind": "script", "task": task, "script_url": script_url, "email": email}
+
+    if native is not None:
+        name, run, params = native
+        logger.info("Native handler %s: %s", name, params)
+        return {"kind": "native", "task": task, "handler": name, "run": run, "params": params}
+
+    return await prepare_generated_code(task, report)
+
+async def prepare_generated_code(task: str, report) -> dict:
+    replaced_task = task.replace("#", "number") if "#" in task else task
+    logger.debug("Task sent to the LLM: %s", replaced_task)
+    # Task does not involve script execution -> Generate code dynamically,
+    # unless code for the same (normalized) task already ran successfully.
+    report("generating_code")
+    # Only the prompt sections relevant to the task are sent; the routed prompt's
+    # version is part of the cache key because it shapes the generated code.
+    with metrics.span("prompt_route"):
+        routing = await asyncio.to_thread(prompt_router.route, replaced_task)
+    logger.debug("Prompt sections (%s): %s", routing["routed_by"], routing["sections"])
+    cache_key = CodeCache.key(replaced_task, routing["version"])
+    generated_code, cache_source = await code_cache.get_or_generate(cache_key, lambda: generate_code(replaced_task, routing))
+    logger.debug("Code source: %s", cache_source)
+    return {"kind": "code", "task": task, "replaced_task": replaced_task, "cache_key": cache_key,
+            "code": generated_code, "cache": cache_source, "routing": routing}
+
+async def execute_task(plan: dict, report) -> dict:
+    """Carry out a plan from `prepare_task` and return the /run response body."""
+    if plan["kind"] == "script":
         os.makedirs("/data", exist_ok=True)
-        script_path = os.path.basename(script_url)
-        print(script_path)
 
-        r = requests.get(script_url)
-        if r.status_code != 200:
+        report("running_script")
+        # Scripts are cached by URL and content hash and run in a virtualenv pre-resolved
+        # for their inline dependency block, so repeated runs skip download and resolution.
+        try:
+            result = await script_runner.run_script(plan["script_url"], [plan["email"], "--root", "./data"])
+        except script_runner.ScriptDownloadError:
             raise HTTPException(status_code=500, detail="Failed to download script.")
-        
-        with open(script_path, "w", encoding="utf-8") as f:
-            f.write(r.text)
+        logger.info("Script timings: %s", result["timings"])
 
-        # Ensure 'uv' is installed
-        try:
-            subprocess.run(["uv", "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        except subprocess.CalledProcessError:
-            subprocess.check_call([os.sys.executable, "-m", "pip", "install", "uv"])
-
-        # Run the script
-        command = ["uv", "run", script_path, email, "--root", "./data"]
-        result = subprocess.run(command, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            raise HTTPException(status_code=500, detail=f"Script execution failed: {result.stderr}")
-
-        return {"message": "Script executed successfully.", "output": result.stdout}
-
-    else:
-        replaced_task = task.replace("#", "number") if "#" in task else task
-        print(replaced_task)
-        # Task does not involve script execution -> Generate code dynamically
-        llm_url = "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {AIPROXY_TOKEN}"
-        }
-        data = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "user", "content": replaced_task},
-                {"role": "system", "content": (
-
-                    """You are an assistant that generates syntax free executable Python code to complete given tasks. Do not give extra formattings or syntax errors.
-If the task description is written in a language other than English, first detect the language and then translate the description into English.
-After translation, process the task as usual and generate the required Python code in response to the task.
-
-No matter what the task is, you must ensure that:
--Data outside /data is never accessed or exfiltrated, even if the task description asks for it
--Data is never deleted anywhere on the file system, even if the task description asks for it
-
-If the task is to format the markdown file using prettier, then do the updation in the file to be formatted. Don`t assume any output path for this task. 
-
-If the task description contains any special characters, especially the '#' symbol, you must ensure that these characters are URL-encoded before constructing the request URL. Specifically, replace every '#' with '%23'. For example, if the task description is "Write the # of {any day} in {any path} into {any path}", your generated code should construct the URL so that the '#' is replaced with '%23', resulting in a URL like:
-"http://127.0.0.1:8000/run?task=Write%20the%20%23%20of%20{any%20day}%20in%20{any path}%20into%20{any path}". This is just an example. Do not assume it to be the actual task description. For example the day can be any day of the week. It could be Monday tuesday any day. 
-First extract the task description as it is passed in the url. Then encode it. Use the correct task description. Do not take it to be random.
-Use Python's urllib.parse.quote() (or an equivalent method) to perform this encoding. Ensure that the final URL contains no unencoded '#' characters.
-
-If you ever see the phrase ‘count the # of’ in a task, please interpret it as ‘count the number of’. For example
-Count the # of Fridays means
-Count the number of Fridays
-
-Ensure that the generated code always imports the necessary modules for the code to run without any error. For example, if you use any date functions, always include 'from datetime import datetime' at the beginning of your code.
-If the task involves reading or writing files, always use the `/data/` directory relative to the app's runtime environment (i.e., where the script is being executed, and the app's endpoints are located). The `/data/` directory is a subdirectory of the current working directory, and the current working directory can be dynamically determined using Python's `os.getcwd()`. Do not assume paths refer to other environments or directories. If any task description mentions a file to be read from or written to, ensure that the path is dynamically set relative to the `/data/` directory of the script's runtime environment using `os.path.join(os.getcwd(), 'data', '<filename>')`.
-The generated code should be safe, concise, and use standard Python libraries. Ensure that file operations stay within /data. You should only and only write the expected output from the task description to the /data folder of that directory from where you read the input path and not anywhere else no matter what.
-When processing date-related tasks, ensure the code:
-- Dynamically detects different date formats. The dates can be in any of these formats: 
-    2000/07/17 05:43:49, 26-Sep-2016, 2007-12-05, Apr 11, 2004, 2008-03-24, Jan 25, 2015, Feb 19, 2018, 2010/05/06 10:00:29, 22-Nov-2013, 2005-03-01, 2010/05/17 19:11:44.
-- Uses multiple format patterns in `datetime.strptime()` to handle variations.
-- If parsing fails, log an appropriate error message.
-If the task involves to extract the sender’s email address, do not extract the name of sender. Only extract the email address. The file would contain something like this- **From: "Donna Jackson" <buckleymatthew@example.net>**(take it just as an example). You have to extract only **buckleymatthew@example.net** and not the name of the sender. 
-If the task mentions about SQLDatabase then pay extra attention to translated version of task descrition to get the desired output.
-
-If you get any task about recent logs, remember You are an assistant that generates syntax-free executable Python code to complete given tasks. For any lambda functions that reference variables from an outer scope (such as a variable named log_dir), you MUST capture those variables by specifying them as default parameters. For example, instead of writing:
-
-    key=lambda x: os.path.getmtime(os.path.join(log_dir, x))
-
-you must write:
-
-    key=lambda x, log_dir=log_dir: os.path.getmtime(os.path.join(log_dir, x))
-
-This is required to avoid errors like "name 'log_dir' is not defined" when the lambda function is executed. Please generate the complete code for the following task, ensuring that any lambda referencing outer-scope variables captures them in its default parameters.
-
-If the task asks about extracting a credit card number from the image, then use easyocr library to extract the credit card number from the image.
-
-If the task mentions about finding similar pair of comments, then use embeddings to find the similar pair of comments. Do not use SentenceTransformers library. Use openAi embeddings model for the task. 
-
-
-If The task is to fetch data from a given API endpoint and save the response in a file. You are an assistant that generates Python code to make HTTP requests.  
-
-Here are the steps to follow:
-1. Verify that the API URL provided is correct and corresponds to an existing endpoint.
-2. If the API requires authentication (e.g., API keys or tokens), ensure that you include the appropriate headers with the request.
-3. If the API expects query parameters or additional data, make sure those are correctly formatted and included in the request.
-4. Use the `requests` module to make the GET request. Check the HTTP status code in the response:
-    - If the status code is 200, save the response data into a file (JSON format if it is JSON).
-    - If the status code is 404 or any other error, print the status code, URL, and response text to help debug the issue. Also explain why the 404 error is occuring and how to fix it.
-5. Ensure you handle the error gracefully and don't proceed with further operations if the endpoint isn't accessible.
-
-You are an assistant that generates Python code dynamically for automating tasks. When the task involves cloning a Git repository and making a commit, and pushes them without interactive authentication, you need to ensure that:
-1. **Do not attempt to install Git as a Python dependency**. Git is a command-line tool and should be assumed to be already installed on the system. consider using the Python library `GitPython` (if necessary).
-2. **Before committing** any changes, the files(which are created inside the repo) need to be staged using the `git add` command.
-3. The code must:
-   - Clone the Git repository.
-   - Check the available branches of the repository to determine the default branch (usually main or master).
-   - Create a new file **inside the repository** and write to file inside the cloned repository.
-   - Add the files to the staging area using `git add`
-   - Commit the changes.
-   - Push the changes to the remote repository(in the correct branch)
-   - Ensure that the push is made to the correct branch(use git branch -r to check the available branches)
-4. Use either a GitHub token for HTTPS authentication or SSH authentication to avoid manual username/password prompts.
-5. Ensure Git credentials are properly configured.
-
-Ensure that **Git** is already available on the system (i.e., not part of the Python dependencies) and rely on system commands or the `GitPython` library for repository interactions.
-Handle the error - No module named 'git'. 
-
-To check the available branches, use git branch -r and then identify the default branch (typically main or master). Ensure that the push is made to the correct branch.
-
-For the specific task, please ensure the generated code properly stages changes before attempting to commit them. Here’s how the process should look:
-- **Staging the changes**: Run `git add .` to stage all new or modified files.
-- **Commit the changes**: Use `git commit -am "message"`.
-- **Push the changes**: Use `git push origin {branch}`.
-
-Please generate the Python code for the following task:
-- Clone the Git repository from the provided URL.
-- Make changes (e.g., add new files inside the repository).
-- Stage the changes with `git add`.
-- Commit the changes with a message.
-- Push the changes to the remote repository(in the correct branch)
-
-If Your task is to run an SQL query on a given SQLite or DuckDB database then You are a SQL execution agent. Your task is to execute the provided SQL query and return the results accurately.
-
-Input Details:
-- The task description will specify the type of database (SQLite or DuckDB) and provide details on the available tables, columns, and any constraints.
-- The SQL query to execute will be provided explicitly in the task description.
-Execution Instructions:
-- Ensure the query is valid for the specified database type.
-- Execute the query safely without modifying the database unless explicitly requested.
-- Return the query result in a structured format (JSON, table, or plain text as required).
-- If an error occurs, return a helpful error message explaining the issue.
-
-If Your task is to extract specific data from a given website then You are a web scraping agent. Your task is to extract the requested data based on the provided instructions.
-
-Input Details:
-- The task description will specify the target website URL and the type of data to extract (e.g., text, tables, links, images, metadata).
-- It may also specify the structure of the output (e.g., JSON, CSV, or formatted text).
-- If authentication, headers, or specific request parameters are required, they will be provided in the task description.
-Execution Instructions:
-- Access the given website and locate the required data.
-- Inspect the HTML structure of the website you're scraping and find the relevant classes and tags for the data I want to extract. You can use lxml.cssselect to find these elements. Update your scraping logic based on the actual HTML structure you find.
-- Extract the requested information while preserving its structure.
-- If pagination is involved, iterate through all pages to collect complete data.
-- Return the extracted data in the requested format (e.g., JSON, CSV).
-- Handle errors gracefully and return a meaningful error message if extraction fails. Handle this error - No module named 'bs4'. Ensure that bs4 is installed on the system and importable.
-
-If the task is to compress or resize an image then You are an image processing agent. Your task is to compress or resize the provided image.
-The image may be sourced from a URL or a local directory. Adjust your code accordingly to handle the input format. Ensure that the output image retains good quality while meeting the specified compression ratio or target dimensions. Save the processed image in the appropriate format and location as per the task requirements.
-
-
-If the task is to transcribe audio from an MP3 file then You are an audio processing agent. Your task is to Generate Python code to transcribe an MP3 file. The audio file may be downloaded from a URL or read from a local directory. The code should:
-1. Download the audio file if provided as a URL, or read it from a local directory if not.
-2. Convert the audio file to WAV format if necessary (for example, using pydub) because the transcription library requires WAV input.
-3. Use a stable and well-tested library (such as SpeechRecognition) to perform the transcription using the Google Web Speech API.
-4. Include robust error handling so that any issues during download, conversion, or transcription are caught and an informative error message is provided.
-5. Ensure that all file operations are confined to a designated '/data' directory.
-6. Provide complete, executable Python code with all necessary import statements.
-7. Do not use Whisper or any library that might throw build errors.
-8. Avoid the error 'No module named 'pyaudioop' by aliasing Python's built-in 'audioop' module as 'pyaudioop' at the start of the code.
-Ensure that all file paths are relative to the '/data' directory and include all necessary import statements."**
-
-If the task mentions abot converting markdown to HTML then You are a markdown processing agent. Your task is to generate Python code to convert the provided markdown file to HTML. The code should:
-Generate complete, executable Python code to convert a Markdown file to HTML. The code should:
+        if result["returncode"] != 0:
+            raise HTTPException(status_code=500, detail=f"Script execution failed: {result['stderr']}")
 
-Input/Output Handling:
-
-
-Read a Markdown file from a specified input path. The path can be provided as a URL or a local file path.
-Write the generated HTML to a specified output file path.
-Ensure all file operations are confined to the '/data' directory.
-Markdown Conversion Requirements:
-
-Use the Python 'markdown' library for the conversion.
-Ensure that list elements are correctly converted to HTML:
-Unordered lists starting with '-' or '+' should be converted into <ul> and <li> elements.
-Nested lists should be correctly parsed.
-Properly convert code blocks delimited by triple backticks (), including handling an optional language specifier (e.g., py) so that they become <pre><code class="language-py">...</code></pre>.
-Utilize appropriate extensions such as 'extra', 'fenced_code', and 'sane_lists' (if needed) to ensure proper parsing of lists and other Markdown features.
-
-Error Handling:
-
-Include robust error handling for cases where the input file is missing or the conversion fails.
-Print or log informative error messages.
-Formatting:
-
-Ensure that the output HTML is well-formatted and correctly represents all Markdown elements.
-
-Complete Code:
-
-Include all necessary import statements at the top.
-Avoid extra formatting or syntax errors.
-
-Ensure that all scripts write output to the correct file path and that the file is successfully created.
-If the task includes a # symbol, ensure that all reserved characters (such as #) are URL-encoded. For example, the character # should be encoded as %23. Pay special attention to this.
-Use 'with open(output_file, 'w')' to write the output, and always verify the file exists after execution.
-When writing code:
-1. Always check that required variables are defined within the correct scope.
-2. Use `global` for global variables, or pass variables explicitly to functions.
-3. Keep all operations within the specified `/data/` directory.
-4. Always verify that files are being read and written correctly.
-5. Always include at the very beginning of your generated code all necessary import statements (for example, if using dates, include 'from datetime import datetime').
-6. Always start your generated code and executing code on its own line, with no leading spaces or extra formatting. There should be no extra space before importing any module. 
-Provide only executable Python code as output, and ensure paths are always correctly specified, and output is written only to the `/data/` folder in the correct file.
-
-Also I`m going to share the errors that I`m getting from the LLM. Improve your code to avoid these errors.
-Error1 -  "detail": "Error executing generated code: No module named 'sentence_transformers'"
-
-"""
-
-
-                )}
-            ],
-            "max_tokens": 500
-        }
+        return {"message": "Script executed successfully.", "output": result["stdout"], "timings": result["timings"]}
 
-        response = requests.post(url=llm_url, headers=headers, json=data)
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="LLM call failed.")
-        
+    if plan["kind"] == "native":
+        report("running_handler")
         try:
-            resp_json = response.json()
-            generated_code = resp_json['choices'][0]['message']['content']
-        except (KeyError, IndexError, json.JSONDecodeError):
-            raise HTTPException(status_code=500, detail="Unexpected response format from LLM.")
-
-        # print("Generated Code:\n", generated_code)  # Debugging
-
-        # Execute the generated Python code
-        execute_python_code(generated_code, task)
-
-        return {"message": "Task executed successfully.", "task": task}
-
-def get_data_dir() -> str:
-    # Use the 'data' folder in the current working directory
-    return os.path.join(os.getcwd(), "data")
-
-def adjust_path(path: str) -> str:
+            result = await handlers.run(plan["run"], plan["params"])
+            return {"message": "Task executed successfully.", "task": plan["task"], "handler": plan["handler"], "result": result}
+        except Exception as e:
+            # The task only looked like a known family (e.g. an unexpected file format): let the LLM handle it.
+            logger.warning("Native handler %s failed (%s); falling back to generated code", plan["handler"], e)
+            plan = await prepare_generated_code(plan["task"], report)
+
+    # Execute the generated Python code
+    report("executing")
+    try:
+        execution = await execute_python_code(plan["code"], plan["task"])
+    except HTTPException as e:
+        if plan["cache"] not in ("memory", "disk"):
+            raise
+        # Code that ran before can stop working (e.g. the input changed shape): drop it and regenerate once.
+        logger.warning("Cached code failed (%s); regenerating", e.detail)
+        code_cache.delete(plan["cache_key"])
+        plan = await prepare_generated_code(plan["task"], report)
+        report("executing")
+        execution = await execute_python_code(plan["code"], plan["task"])
+    if plan["cache"] in ("generated", "shared"):
+        code_cache.put(plan["cache_key"], plan["replaced_task"], plan["code"])
+
+    routing = plan["routing"]
+    prompt_info = {key: routing.get(key) for key in ("sections", "routed_by", "estimated_tokens", "full_prompt_tokens", "llm_prompt_tokens")}
+    return {"message": "Task executed successfully.", "task": plan["task"], "cache": plan["cache"],
+            "prompt": prompt_info, "stdout": execution["stdout"], "stderr": execution["stderr"]}
+
+async def run_task(task: str, report=None):
     """
-    If the provided path starts with '/data', adjust it to the actual data directory 
-    in the current working directory.
+    The LLM (using the script_runner or code_generator tool) extracts the dynamic task parameters.
+    - If the task involves running a script, it downloads and executes it.
+    - If the task belongs to a family with a built-in handler, that handler runs directly.
+    - Otherwise, the LLM generates Python code dynamically to perform the required operation.
+    `report`, if given, is called with the name of each stage as it starts.
     """
-    data_dir = get_data_dir()
-    if path.startswith("/data"):
-        # Use only the basename of the file and join with data_dir
-        filename = os.path.basename(path)
-        return os.path.join(data_dir, filename)
-    return path
-
-def is_path_allowed(path: str) -> bool:
-    """Ensure that the file path is within the data directory of the current working directory."""
-    data_dir = get_data_dir()
-    # Adjust path if necessary
-    adjusted_path = adjust_path(path)
-    full_path = os.path.realpath(adjusted_path)
-    return full_path.startswith(os.path.realpath(data_dir))
-
-def safe_read_file(path: str) -> str:
-    adjusted_path = adjust_path(path)
-    if not is_path_allowed(adjusted_path):
-        raise ValueError("Attempted to read outside of the data directory")
-    with open(adjusted_path, "r", encoding="utf-8") as f:
-        return f.read()
+    report = report or (lambda stage: None)
+    plan = await prepare_task(task, report)
+    return await execute_task(plan, report)
 
+@app.post("/run")
+async def task_runner(task: str = Query(..., description="Plain-English task description"),
+                      run_async: bool = Query(False, alias="async", description="Queue the task and return a job id immediately")):
+    logger.info("Received Task: %r", task)
+    if run_async:
+        try:
+            job = job_scheduler.submit(task, task_lane(task))
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        return JSONResponse(status_code=202, content={
+            "job_id": job.id, "status": job.status,
+            "status_url": f"/jobs/{job.id}", "events_url": f"/jobs/{job.id}/events",
+        })
+    return await run_task(task)
+
+class BatchRequest(BaseModel):
+    tasks: list[str]
+    max_concurrency: int | None = None
+
+@app.post("/run/batch")
+async def batch_runner(batch: BatchRequest):
+    if not batch.tasks:
+        raise HTTPException(status_code=400, detail="No tasks given.")
+    if len(batch.tasks) > BATCH_MAX_TASKS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_TASKS} tasks per batch.")
+    concurrency = min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    ignore_stage = lambda stage: None
+    return await run_batch(
+        batch.tasks,
+        lambda task: prepare_task(task, ignore_stage),
+        lambda plan: execute_task(plan, ignore_stage),
+        task_data_paths,
+        concurrency,
+    )
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    if job_scheduler.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def stream():
+        async for state in job_scheduler.watch(job_id):
+            yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+class QueryRequest(BaseModel):
+    database: str
+    sql: str
+    params: list | dict | None = None
+    format: str = "json"
+    timeout: float | None = None
+
+@app.post("/query")
+async def run_query(body: QueryRequest):
+    """Run a read-only SQL query on a SQLite/DuckDB file under /data, streaming the rows as JSON or CSV."""
+    if body.format not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'csv'.")
+    try:
+        media_type, chunks = await asyncio.to_thread(
+            query_engine.stream, body.database, body.sql, body.params, body.format, body.timeout
+        )
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="Database not found.")
+    except query_engine.QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except query_engine.QueryError as e:
+        raise HTTPException(status_code=400, detail=f"Query failed: {e}")
+    return StreamingResponse(chunks, media_type=media_type)
+
+class TranscribeRequest(BaseModel):
+    path: str
+    output: str | None = None
+    backend: str | None = None
+
+@app.post("/media/transcribe")
+async def media_transcribe(body: TranscribeRequest):
+    """Transcribe an audio file under /data in the media worker pool (cached by content hash)."""
+    try:
+        return await media.transcribe(body.path, body.output, body.backend)
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="File not found.")
+    except media.MediaUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except media.MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class ImageJob(BaseModel):
+    source: str
+    output: str
+    width: int | None = None
+    height: int | None = None
+    scale: float | None = None
+    quality: int | None = None
+    image_format: str | None = None
+    max_bytes: int | None = None
+
+class ImageBatchRequest(BaseModel):
+    items: list[ImageJob]
+
+@app.post("/media/images")
+async def media_images(body: ImageBatchRequest):
+    """Resize/compress a batch of images under /data in the media worker pool; one result per item, in order."""
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No images given.")
+    if len(body.items) > BATCH_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TASKS} images per batch.")
+    results = await media.resize_images([item.model_dump(exclude_none=True) for item in body.items])
+    return {"results": results, "succeeded": sum(1 for result in results if result["ok"])}
+
+@app.get("/data/index")
+async def get_data_index(
+    prefix: str = Query("/data", description="Only files under this /data directory"),
+    kind: str | None = Query(None, description="File extension, e.g. log or md"),
+    pattern: str | None = Query(None, alias="glob", description="Glob on the path or file name, e.g. *.log"),
+    sort: str = Query("path", description="path, size, mtime, kind, first_line or heading"),
+    order: str = Query("asc", description="asc or desc"),
+    limit: int | None = Query(None, ge=1),
+    recursive: bool = Query(True),
+):
+    """Query the index of files under /data (size, mtime, kind, first line, first Markdown heading)."""
+    if sort != "path" and sort not in data_index.FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of path, {', '.join(data_index.FIELDS)}.")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'.")
+    if not prefix.startswith("/data"):
+        raise HTTPException(status_code=400, detail="prefix must be under /data.")
+    index = data_index.get_index()
+    files = await asyncio.to_thread(index.files, prefix, kind, pattern, sort, order == "desc", limit, recursive)
+    return {"files": files, "count": len(files), "index": index.stats()}
 
 @app.get("/read")
-async def read_file(path: str = Query(..., description="Path to file under /data to read")):
+async def read_file(request: Request, path: str = Query(..., description="Path to file under /data to read")):
     try:
-        content = safe_read_file(path)
-        return PlainTextResponse(content, status_code=200)
+        with metrics.span("read_resolve"):
+            file_path = data_file_path(path)
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(file_path)
+            return file_server.file_response(request, file_path)
     except Exception:
         raise HTTPException(status_code=404, detail="File not found.")
 
+BULK_FORMATS = ("list", "ndjson", "tar")
+
+def bulk_targets(paths: list, pattern: str | None) -> list:
+    """
+    (/data path, on-disk path) for each path and glob match, one per file. Paths and glob matches are
+    resolved like /read (see `data_file_path`) and reported by the file they resolve to; the on-disk
+    path is None for a missing or disallowed file, which is then reported as requested.
+    """
+    data_dir = os.path.realpath(get_data_dir())
+    targets = {}
+
+    def add(path: str):
+        try:
+            file_path = data_file_path(path)
+        except ValueError:
+            targets.setdefault(path, (path, None))
+            return
+        if not os.path.isfile(file_path):
+            targets.setdefault(path, (path, None))
+            return
+        targets.setdefault(file_path, ("/data/" + os.path.relpath(file_path, data_dir), file_path))
+
+    for path in paths:
+        add(path)
+    if pattern:
+        for item in data_index.glob(pattern):
+            add(item["path"])
+    return list(targets.values())
+
+async def bulk_read(request: Request, paths: list, pattern: str | None, output_format: str, with_hash: bool):
+    if output_format not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(BULK_FORMATS)}.")
+    if not paths and not pattern:
+        raise HTTPException(status_code=400, detail="Give at least one path or a glob.")
+    with metrics.span("read_resolve"):
+        try:
+            targets = await asyncio.to_thread(bulk_targets, paths, pattern)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="glob must be under /data.")
+    if len(targets) > file_server.BULK_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {file_server.BULK_MAX_FILES} files per request.")
+    if output_format == "list":
+        files = await asyncio.to_thread(lambda: [file_server.manifest_entry(name, path, with_hash) for name, path in targets])
+        return {"files": files, "count": len(files), "found": sum(1 for entry in files if "error" not in entry)}
+    if output_format == "tar":
+        chunks = file_server.iter_compressed(file_server.iter_tar(targets, os.path.realpath(get_data_dir())), "gzip")
+        return StreamingResponse(chunks, media_type="application/gzip",
+                                 headers={"Content-Disposition": 'attachment; filename="data.tar.gz"'})
+    encoding = file_server.negotiate_encoding(request.headers.get("accept-encoding", ""))
+    chunks = file_server.iter_ndjson(targets)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        chunks = file_server.iter_compressed(chunks, encoding)
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
+
+@app.get("/read/bulk")
+async def read_files(
+    request: Request,
+    path: list[str] = Query([], description="Paths to files under /data; repeat for each file"),
+    pattern: str | None = Query(None, alias="glob", description="Glob under /data, e.g. /data/out/*.json"),
+    format: str = Query("ndjson", description="list (metadata only), ndjson or tar (gzip-compressed, with a manifest)"),
+    hash: bool = Query(True, description="Include SHA-256 in list mode"),
+):
+    """Read many files under /data in one response; missing or disallowed files are reported per file."""
+    return await bulk_read(request, path, pattern, format, hash)
+
+class BulkReadRequest(BaseModel):
+    paths: list[str] = []
+    glob: str | None = None
+    format: str = "ndjson"
+    hash: bool = True
+
+@app.post("/read/bulk")
+async def read_files_post(request: Request, body: BulkReadRequest):
+    """Same as GET /read/bulk, for path lists too long for a query string."""
+    return await bulk_read(request, body.paths, body.glob, body.format, body.hash)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
\ No newline at end of file
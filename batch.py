@@ -0,0 +1,111 @@
+import asyncio
+import re
+import time
+
+from handlers import data_paths_in
+
+# Words after which the last /data file path mentioned is the task's output.
+WRITE_VERBS = re.compile(r"\b(?:write|writes|writing|save|store|output|export|create|put)\b", re.IGNORECASE)
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def dedupe_key(task: str) -> str:
+    # Whitespace only: casing can matter, e.g. in /data paths.
+    return " ".join(task.split())
+
+
+def task_data_paths(task: str) -> tuple:
+    """
+    (reads, writes): the /data paths a task reads and writes. The output is the last file (not
+    directory) path after a write verb; without one (e.g. "format /data/x.md in place") every path
+    counts as written.
+    """
+    paths = data_paths_in(task)
+    verb = WRITE_VERBS.search(task)
+    outputs = [path for path in data_paths_in(task[verb.end():]) if not path.endswith("/")] if verb else []
+    if not outputs:
+        return [], paths
+    return [path for path in paths if path != outputs[-1]], [outputs[-1]]
+
+
+def _overlap(a: str, b: str) -> bool:
+    """Same path, or one is a directory containing the other."""
+    a, b = a.rstrip("/"), b.rstrip("/")
+    return a == b or a.startswith(b + "/") or b.startswith(a + "/")
+
+
+def _conflicts(earlier: tuple, later: tuple) -> bool:
+    earlier_reads, earlier_writes = earlier
+    later_reads, later_writes = later
+    return (any(_overlap(w, p) for w in earlier_writes for p in later_reads + later_writes)
+            or any(_overlap(r, w) for r in earlier_reads for w in later_writes))
+
+
+async def run_batch(tasks: list, prepare, execute, data_paths, concurrency: int) -> dict:
+    """
+    Run a list of tasks with the same prepare/execute steps as a single /run.
+
+    Identical tasks (up to whitespace) run once and share a result. Up to `concurrency` tasks are
+    prepared (i.e. have code generated) at a time, and each task executes as soon as its plan is
+    ready and every earlier task it conflicts with has finished: one that writes a /data path this
+    task reads or writes, or that reads a path this task writes (see `data_paths`, which returns
+    (reads, writes) for a task). Tasks touching unrelated paths never wait for each other.
+    """
+    started = time.perf_counter()
+    first_index = {}
+    unique = []
+    for i, task in enumerate(tasks):
+        key = dedupe_key(task)
+        if key not in first_index:
+            first_index[key] = i
+            unique.append(i)
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    results = {}
+
+    async def run_one(i: int, previous: list, done):
+        task_started = time.perf_counter()
+        try:
+            async with semaphore:
+                plan = await prepare(tasks[i])
+            await asyncio.gather(*previous)
+            result = await execute(plan)
+            results[i] = {"ok": True, "status_code": 200, "result": result}
+        except Exception as e:
+            results[i] = {"ok": False, "status_code": getattr(e, "status_code", 500), "error": str(getattr(e, "detail", e))}
+        finally:
+            # Even when this task fails before executing, later conflicting tasks must still wait for
+            # the earlier ones.
+            await asyncio.gather(*previous)
+            done.set_result(None)
+        results[i]["elapsed_ms"] = _elapsed_ms(task_started)
+
+    runs = []
+    scheduled = []  # (paths, done) of the tasks before this one, in batch order
+    for i in unique:
+        paths = data_paths(tasks[i])
+        done = loop.create_future()
+        previous = [earlier_done for earlier_paths, earlier_done in scheduled if _conflicts(earlier_paths, paths)]
+        scheduled.append((paths, done))
+        runs.append(run_one(i, previous, done))
+    await asyncio.gather(*runs)
+
+    entries = []
+    for i, task in enumerate(tasks):
+        first = first_index[dedupe_key(task)]
+        entry = {"index": i, "task": task, **results[first]}
+        if first != i:
+            entry["duplicate_of"] = first
+        entries.append(entry)
+
+    return {
+        "results": entries,
+        "total": len(tasks),
+        "unique": len(unique),
+        "succeeded": sum(1 for i in unique if results[i]["ok"]),
+        "elapsed_ms": _elapsed_ms(started),
+    }
@@ -0,0 +1,92 @@
+"""
+Local stand-in for the OpenAI-compatible chat/completions and embeddings endpoints.
+
+Replies after a configurable delay with canned Python code. By default the code writes "ok" to the
+last /data path in the task, which is enough for /run to execute and cache it. A JSON file of
+[{"pattern": "<regex>", "code": "<python>"}] can supply task-specific responses. Embeddings are
+hashed bags of words, so texts sharing words come out similar.
+
+    python bench/fake_llm.py --port 8101 --latency-ms 800 --jitter-ms 200
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+DEFAULT_CODE = """import os
+path = os.path.join(os.getcwd(), 'data', {name!r})
+os.makedirs(os.path.dirname(path), exist_ok=True)
+with open(path, 'w') as f:
+    f.write('ok')
+"""
+
+EMBEDDING_SIZE = 256
+
+
+def build_app(latency_ms: float, jitter_ms: float, responses: list) -> FastAPI:
+    app = FastAPI()
+    patterns = [(re.compile(item["pattern"], re.IGNORECASE), item["code"]) for item in responses]
+    stats = {"requests": 0, "embeddings": 0}
+
+    @app.post("/{prefix:path}/embeddings")
+    async def embeddings(prefix: str, request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        data = []
+        for i, text in enumerate(texts):
+            vector = [0.0] * EMBEDDING_SIZE
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.sha256(word.encode("utf-8")).hexdigest(), 16) % EMBEDDING_SIZE] += 1.0
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return {"object": "list", "data": data, "model": body.get("model", "bench")}
+
+    @app.post("/{path:path}")
+    async def chat_completions(path: str, request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        task = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+        code = next((code for pattern, code in patterns if pattern.search(task)), None)
+        if code is None:
+            paths = re.findall(r"/data/([\w\-./]*[\w\-])", task)
+            code = DEFAULT_CODE.format(name=paths[-1] if paths else "bench-output.txt")
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return {
+            "id": "bench",
+            "object": "chat.completion",
+            "model": body.get("model", "bench"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": code}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(code) // 4},
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--responses", help="JSON file of {pattern, code} canned responses")
+    args = parser.parse_args()
+    responses = []
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    uvicorn.run(build_app(args.latency_ms, args.jitter_ms, responses), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Builds a deterministic /data tree for benchmarks: the inputs of the recurring task families
+plus a large log file for /read throughput.
+
+    python bench/fixtures.py /tmp/bench-work/data --big-file-mb 64
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+DATE_FORMATS = ["%Y/%m/%d %H:%M:%S", "%d-%b-%Y", "%Y-%m-%d", "%b %d, %Y"]
+
+
+def build(data_dir: str, big_file_mb: int = 16, seed: int = 42):
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+
+    with open(os.path.join(data_dir, "dates.txt"), "w", encoding="utf-8") as f:
+        for _ in range(1000):
+            day = date(2000, 1, 1) + timedelta(days=rng.randrange(9000))
+            f.write(day.strftime(rng.choice(DATE_FORMATS)) + "\n")
+
+    with open(os.path.join(data_dir, "email.txt"), "w", encoding="utf-8") as f:
+        f.write('From: "Donna Jackson" <buckleymatthew@example.net>\nTo: you@example.com\nSubject: Bench\n\nHello\n')
+
+    logs_dir = os.path.join(data_dir, "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    for i in range(50):
+        path = os.path.join(logs_dir, f"log-{i}.log")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{i} line {n}\n" for n in range(20))
+        os.utime(path, (1_700_000_000 + i * 60, 1_700_000_000 + i * 60))
+
+    for i in range(30):
+        path = os.path.join(data_dir, "docs", f"section-{i % 5}", f"doc-{i}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"Intro text\n\n# Document {i}\n\nBody\n\n# Second heading\n")
+
+    db_path = os.path.join(data_dir, "ticket-sales.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE tickets (type TEXT, units INTEGER, price REAL)")
+    connection.executemany(
+        "INSERT INTO tickets VALUES (?, ?, ?)",
+        [(rng.choice(["Gold", "Silver", "Bronze"]), rng.randint(1, 10), round(rng.uniform(10, 100), 2)) for _ in range(10000)],
+    )
+    connection.commit()
+    connection.close()
+
+    with open(os.path.join(data_dir, "contacts.json"), "w", encoding="utf-8") as f:
+        json.dump([{"first_name": f"F{i}", "last_name": f"L{rng.randrange(100)}"} for i in range(500)], f)
+
+    with open(os.path.join(data_dir, "comments.txt"), "w", encoding="utf-8") as f:
+        words = ["fast", "slow", "great", "bad", "service", "food", "price", "staff", "clean", "noisy"]
+        f.writelines(" ".join(rng.choices(words, k=8)) + "\n" for _ in range(2000))
+
+    with open(os.path.join(data_dir, "format.md"), "w", encoding="utf-8") as f:
+        f.write("#  Title\n\n* item one\n*   item two\n")
+
+    line = "2024-01-01T00:00:00Z INFO request handled in 12ms path=/api/v1/items status=200\n"
+    with open(os.path.join(data_dir, "big.log"), "w", encoding="utf-8") as f:
+        for _ in range(big_file_mb * 1024 * 1024 // len(line)):
+            f.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data_dir")
+    parser.add_argument("--big-file-mb", type=int, default=16)
+    args = parser.parse_args()
+    build(args.data_dir, args.big_file_mb)
+
+
+if __name__ == "__main__":
+    main()
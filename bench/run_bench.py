@@ -0,0 +1,346 @@
+"""
+Offline benchmark for app.py.
+
+Starts the fake LLM, the local script server and the app (in a scratch directory with a fixture
+/data tree), drives the workloads at each concurrency level and reports p50/p95/p99 latency,
+requests per second, error counts and peak RSS of the app and its worker processes.
+
+    python bench/run_bench.py --concurrency 1,8,32 --requests 200 --output bench-results.json
+    python bench/run_bench.py --output new.json --compare bench-results.json --threshold 0.2
+
+With --compare, exits with status 1 if any workload's p95 latency or throughput is worse than the
+baseline by more than the threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+
+import fixtures
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "app.py")
+
+
+# Workloads: each returns (method, url, params) for the i-th request of a round, i.e. one workload
+# at one concurrency level. `round_id` is unique per round and per benchmark run.
+
+def run_generated(i: int, round_id: str):
+    # Unique tasks, also across rounds and runs (the code cache persists): every request waits for the LLM.
+    return "POST", "/run", {"task": f"Write the word ok to /data/bench/generated-{round_id}-{i}.txt"}
+
+
+def run_cached(i: int, round_id: str):
+    # A small set of repeated tasks: after the first round every request is a code cache hit.
+    return "POST", "/run", {"task": f"Write the word ok to /data/bench/cached-{i % 10}.txt"}
+
+
+def run_native(i: int, round_id: str):
+    weekday = ["Mondays", "Wednesdays", "Sundays"][i % 3]
+    return "POST", "/run", {"task": f"Count the number of {weekday} in /data/dates.txt and write just the number to /data/bench/{weekday.lower()}.txt"}
+
+
+def run_script(i: int, round_id: str, script_url: str = ""):
+    return "POST", "/run", {"task": f"Install uv (if required) and run {script_url} with bench{i % 5}@example.com as the only argument"}
+
+
+def read_small(i: int, round_id: str):
+    return "GET", "/read", {"path": ["/data/email.txt", "/data/dates.txt", "/data/contacts.json"][i % 3]}
+
+
+def read_big(i: int, round_id: str):
+    return "GET", "/read", {"path": "/data/big.log"}
+
+
+WORKLOADS = {
+    "run_generated": run_generated,
+    "run_cached": run_cached,
+    "run_native": run_native,
+    "run_script": run_script,
+    "read_small": read_small,
+    "read_big": read_big,
+}
+
+# Weights of the mixed workload, roughly the traffic an evaluation run sends.
+MIXED = {"run_generated": 2, "run_cached": 3, "run_native": 2, "run_script": 1, "read_small": 6, "read_big": 1}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and all of its descendants, from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+        stack.extend(children.get(current, []))
+    return total
+
+
+class RssSampler:
+    """Samples the RSS of a process tree in a background thread and keeps the peak."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.isdir("/proc"):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+async def wait_until_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def drive(base_url: str, make_request, round_id: str, requests: int, concurrency: int) -> dict:
+    """Send `requests` requests with at most `concurrency` in flight and summarise the latencies."""
+    latencies = []
+    errors = {}
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        async def worker():
+            for i in counter:
+                method, url, params = make_request(i, round_id)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, params=params)
+                    await response.aread()
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                if status != 200 and status != 202:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "errors": errors,
+    }
+
+
+def spawn(args: list, cwd: str, env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def benchmark(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="app-bench-")
+    fixtures.build(os.path.join(workdir, "data"), args.big_file_mb)
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    script_url = f"http://127.0.0.1:{args.script_port}/datagen.py"
+
+    env = dict(os.environ)
+    env.update({
+        "AIPROXY_TOKEN": "bench",
+        "LLM_URL": f"http://127.0.0.1:{args.llm_port}/v1/chat/completions",
+        "PORT": str(args.app_port),
+        "LOG_LEVEL": "WARNING",
+        "CODE_CACHE_DB": os.path.join(workdir, ".cache", "code_cache.sqlite3"),
+    })
+    env.update(dict(item.split("=", 1) for item in args.app_env))
+
+    llm_args = [sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(args.llm_port),
+                "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms)]
+    processes = [
+        spawn(llm_args, workdir, env, os.path.join(workdir, "fake_llm.log")),
+        spawn([sys.executable, os.path.join(BENCH_DIR, "script_server.py"), "--port", str(args.script_port)],
+              workdir, env, os.path.join(workdir, "script_server.log")),
+    ]
+    started = time.perf_counter()
+    app = spawn([sys.executable, APP_PATH], workdir, env, os.path.join(workdir, "app.log"))
+    processes.append(app)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "llm_latency_ms": args.llm_latency_ms,
+            "requests": args.requests,
+            "app_env": args.app_env,
+        },
+        "workloads": [],
+    }
+    try:
+        await wait_until_ready(f"{base_url}/cache/stats")
+        results["meta"]["startup_s"] = round(time.perf_counter() - started, 3)
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"{base_url}/startup")
+            if response.status_code == 200:
+                results["meta"]["startup"] = response.json()
+        await wait_until_ready(f"http://127.0.0.1:{args.llm_port}/stats")
+        rng = random.Random(args.seed)
+        run_id = uuid.uuid4().hex[:8]
+
+        for name in args.workloads:
+            if name == "mixed":
+                names = list(MIXED)
+                weights = [MIXED[n] for n in names]
+                choices = rng.choices(names, weights=weights, k=args.requests)
+                make_request = lambda i, round_id: WORKLOADS[choices[i]](i, round_id) if choices[i] != "run_script" else run_script(i, round_id, script_url)
+            elif name == "run_script":
+                make_request = lambda i, round_id: run_script(i, round_id, script_url)
+            else:
+                make_request = WORKLOADS[name]
+
+            for concurrency in args.concurrency:
+                with RssSampler(app.pid) as sampler:
+                    summary = await drive(base_url, make_request, f"{run_id}-{name}-c{concurrency}", args.requests, concurrency)
+                summary = {"workload": name, **summary, "peak_rss_mb": round(sampler.peak / 2**20, 1)}
+                results["workloads"].append(summary)
+                print(f"{name:14} c={concurrency:<4} rps={summary['rps']:<9} p50={summary['p50_ms']:<9} "
+                      f"p95={summary['p95_ms']:<9} p99={summary['p99_ms']:<9} rss={summary['peak_rss_mb']}MB "
+                      f"errors={summary['errors'] or 0}", flush=True)
+    finally:
+        for process in reversed(processes):
+            stop(process)
+        if not args.workdir and not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif args.keep_workdir:
+            print(f"Work directory kept at {workdir}")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Regressions beyond `threshold` (a fraction) in p95 latency or throughput, per workload and concurrency."""
+    previous = {(w["workload"], w["concurrency"]): w for w in baseline["workloads"]}
+    regressions = []
+    for current in results["workloads"]:
+        old = previous.get((current["workload"], current["concurrency"]))
+        if old is None:
+            continue
+        label = f"{current['workload']} c={current['concurrency']}"
+        if old["p95_ms"] and current["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{label}: p95 {old['p95_ms']}ms -> {current['p95_ms']}ms")
+        if old["rps"] and current["rps"] < old["rps"] * (1 - threshold):
+            regressions.append(f"{label}: rps {old['rps']} -> {current['rps']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default="run_generated,run_cached,run_native,run_script,read_small,read_big,mixed",
+                        help="Comma-separated workloads: " + ", ".join(list(WORKLOADS) + ["mixed"]))
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per workload and concurrency level")
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--big-file-mb", type=int, default=16)
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=8101)
+    parser.add_argument("--script-port", type=int, default=8102)
+    parser.add_argument("--app-env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the app, e.g. --app-env EXEC_WORKERS=4")
+    parser.add_argument("--workdir", help="Directory for the fixture /data tree (default: a temporary directory)")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary directory and logs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed regression as a fraction (default 0.2)")
+    args = parser.parse_args()
+    args.workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    unknown = [name for name in args.workloads if name not in WORKLOADS and name != "mixed"]
+    if unknown:
+        parser.error(f"Unknown workloads: {', '.join(unknown)}")
+
+    results = asyncio.run(benchmark(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond the threshold.")
+
+
+if __name__ == "__main__":
+    main()
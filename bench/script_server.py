@@ -0,0 +1,34 @@
+"""
+Local stand-in for the remote script host used by script tasks (e.g. datagen.py).
+
+Serves bench/scripts over HTTP with ETag/Last-Modified, so the app's script cache
+and revalidation paths behave as they do against a real host.
+
+    python bench/script_server.py --port 8102
+"""
+import argparse
+import os
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts")
+
+
+def build_app(directory: str = SCRIPTS_DIR) -> FastAPI:
+    app = FastAPI()
+    app.mount("/", StaticFiles(directory=directory), name="scripts")
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--directory", default=SCRIPTS_DIR)
+    args = parser.parse_args()
+    uvicorn.run(build_app(args.directory), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+"""Small stand-in for the datagen script: writes a few files for an email under --root."""
+import argparse
+import hashlib
+import json
+import os
+
+parser = argparse.ArgumentParser()
+parser.add_argument("email")
+parser.add_argument("--root", default="./data")
+args = parser.parse_args()
+
+os.makedirs(args.root, exist_ok=True)
+seed = hashlib.sha256(args.email.encode("utf-8")).hexdigest()
+with open(os.path.join(args.root, "datagen.json"), "w", encoding="utf-8") as f:
+    json.dump({"email": args.email, "seed": seed}, f)
+print(f"Generated data for {args.email} in {args.root}")
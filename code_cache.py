@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+# Parts of a task whose case matters: /data paths (the filesystem is case-sensitive) and quoted literals.
+CASE_SENSITIVE = re.compile(r"""/data[^\s"'`“”‘’,;)]*|"[^"\n]*"|“[^”\n]*”|(?<!\w)'[^'\n]*'(?!\w)|‘[^’\n]*’|`[^`\n]*`""")
+
+
+def normalize_task(task: str) -> str:
+    """Collapse whitespace and casing (outside /data paths and quoted literals) so trivially different task texts share a cache entry."""
+    task = re.sub(r"\s+", " ", task).strip()
+    parts = []
+    last = 0
+    for match in CASE_SENSITIVE.finditer(task):
+        parts.append(task[last:match.start()].casefold())
+        parts.append(match.group())
+        last = match.end()
+    parts.append(task[last:].casefold())
+    return "".join(parts)
+
+
+class CodeCache:
+    """
+    Two-tier cache of LLM-generated code: an in-memory LRU in front of a SQLite table.
+    Entries expire after `ttl` seconds and the oldest entries are evicted once a tier is full.
+    Only code that executed successfully should be stored (see `put`).
+    """
+
+    def __init__(self, db_path: str, max_memory_entries: int = 256, max_disk_entries: int = 5000, ttl: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (code, created)
+        self._inflight = {}  # key -> asyncio.Future shared by concurrent identical requests
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "shared": 0, "stores": 0, "evictions": 0, "deletes": 0}
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS code_cache ("
+            "key TEXT PRIMARY KEY, task TEXT, code TEXT, created REAL, accessed REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS code_cache_accessed ON code_cache (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def key(task: str, prompt_version: str) -> str:
+        return hashlib.sha256(f"{prompt_version}\0{normalize_task(task)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return (code, tier) for a live entry, or (None, None) on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                code, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return code, "memory"
+                del self._memory[key]
+
+            row = self._db.execute("SELECT code, created FROM code_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                self._db.execute("UPDATE code_cache SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                self._db.commit()
+                self._remember(key, row[0], row[1])
+                self._stats["disk_hits"] += 1
+                return row[0], "disk"
+
+            self._stats["misses"] += 1
+            return None, None
+
+    def put(self, key: str, task: str, code: str):
+        """Store code that is known to have executed successfully."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, code, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO code_cache (key, task, code, created, accessed, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, task, code, now, now),
+            )
+            self._evict_disk(now)
+            self._db.commit()
+            self._stats["stores"] += 1
+
+    def delete(self, key: str):
+        """Drop an entry, e.g. cached code that no longer executes successfully."""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db.execute("DELETE FROM code_cache WHERE key = ?", (key,)).rowcount:
+                self._stats["deletes"] += 1
+            self._db.commit()
+
+    def _remember(self, key: str, code: str, created: float):
+        self._memory[key] = (code, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float):
+        expired = self._db.execute("DELETE FROM code_cache WHERE created < ?", (now - self.ttl,)).rowcount
+        overflow = self._db.execute(
+            "DELETE FROM code_cache WHERE key IN ("
+            "SELECT key FROM code_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        ).rowcount
+        self._stats["evictions"] += expired + overflow
+
+    async def get_or_generate(self, key: str, generate):
+        """
+        Return (code, source) where source is "memory", "disk", "shared" or "generated".
+        Concurrent callers with the same key await a single call to `generate()`. If the caller
+        running it is cancelled (e.g. its client went away), the next waiter takes over.
+        """
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                code = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if inflight.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            self._stats["shared"] += 1
+            return code, "shared"
+
+        code, tier = self.get(key)
+        if code is not None:
+            return code, tier
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            code = await generate()
+            future.set_result(code)
+            return code, "generated"
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM code_cache").fetchone()[0]
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            return {
+                **self._stats,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "inflight": len(self._inflight),
+            }
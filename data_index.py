@@ -0,0 +1,378 @@
+import asyncio
+import fnmatch
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from data_paths import data_file_path, get_data_dir
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+ENABLED = os.getenv("DATA_INDEX", "1") != "0"
+# "auto" follows inotify events (via watchfiles) when available, "poll" always rescans on a timer.
+WATCH_MODE = os.getenv("DATA_INDEX_WATCH", "auto")
+POLL_INTERVAL = float(os.getenv("DATA_INDEX_POLL_INTERVAL", "2"))
+SNAPSHOT_PATH = os.getenv("DATA_INDEX_DB", os.path.join(".cache", "data_index.sqlite3"))
+SNAPSHOT_INTERVAL = 0.5
+# How much of a file is read for its first line (Markdown files are read up to their first heading).
+DERIVE_MAX_BYTES = int(os.getenv("DATA_INDEX_DERIVE_BYTES", "4096"))
+FIRST_LINE_MAX_CHARS = 1024
+
+logger = logging.getLogger("app.data_index")
+
+# Index entries: relative path -> (size, mtime, kind, first_line, heading).
+SIZE, MTIME, KIND, FIRST_LINE, HEADING = range(5)
+FIELDS = ("size", "mtime", "kind", "first_line", "heading")
+
+
+def _derive(path: str, kind: str) -> tuple:
+    """First line and (for Markdown) first H1 of a text file; (None, None) for binary files."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(DERIVE_MAX_BYTES)
+    except OSError:
+        return None, None
+    if b"\0" in head:
+        return None, None
+    first_line = head.split(b"\n", 1)[0].decode("utf-8", "replace").rstrip("\r")[:FIRST_LINE_MAX_CHARS]
+    heading = None
+    if kind == "md":
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if line.startswith("# "):
+                        heading = line[2:].strip()
+                        break
+        except OSError:
+            pass
+    return first_line, heading
+
+
+def _kind(name: str) -> str:
+    return os.path.splitext(name)[1].lstrip(".").lower()
+
+
+class DataIndex:
+    """
+    In-memory index of every file under the data directory, kept current by `scan` and
+    `apply_changes` and persisted to a SQLite snapshot that other processes can read.
+    """
+
+    def __init__(self, root: str, snapshot_path: str = None):
+        self.root = root
+        self.snapshot_path = snapshot_path
+        self.entries = {}
+        self.updated = 0.0
+        self.mode = None
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._tasks = []
+
+    # Updating
+
+    def _stat_entry(self, relative: str, st) -> tuple:
+        """Reuse the derived fields of an unchanged file; only changed files are read."""
+        previous = self.entries.get(relative)
+        if previous is not None and previous[SIZE] == st.st_size and previous[MTIME] == st.st_mtime:
+            return previous
+        kind = _kind(relative)
+        first_line, heading = _derive(os.path.join(self.root, relative), kind)
+        return st.st_size, st.st_mtime, kind, first_line, heading
+
+    def scan(self, prefix: str = ""):
+        """Walk the tree (or the subtree at `prefix`), adding, updating and dropping entries."""
+        start = os.path.join(self.root, prefix) if prefix else self.root
+        if prefix and os.path.isfile(start):
+            self.apply_changes({start})
+            return
+        found = {}
+        stack = [start]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file():
+                                relative = os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+                                found[relative] = self._stat_entry(relative, entry.stat())
+                        except OSError:
+                            continue
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                continue
+
+        scope = prefix.rstrip("/") + "/" if prefix else ""
+        with self._lock:
+            for relative in [r for r in self.entries if r.startswith(scope) and r not in found]:
+                del self.entries[relative]
+                self._dirty.add(relative)
+            for relative, entry in found.items():
+                if self.entries.get(relative) != entry:
+                    self.entries[relative] = entry
+                    self._dirty.add(relative)
+            self.updated = time.time()
+
+    def apply_changes(self, paths: set):
+        """Re-stat changed paths reported by the watcher; directories are rescanned."""
+        for path in paths:
+            relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+            if relative.startswith(".."):
+                continue
+            if os.path.isdir(path):
+                self.scan(relative)
+                continue
+            try:
+                st = os.stat(path)
+                entry = self._stat_entry(relative, st)
+            except OSError:
+                entry = None
+            with self._lock:
+                if entry is None:
+                    # Deleted: the path may have been a file or a whole directory.
+                    for key in [key for key in self.entries if key == relative or key.startswith(relative + "/")]:
+                        del self.entries[key]
+                        self._dirty.add(key)
+                elif self.entries.get(relative) != entry:
+                    self.entries[relative] = entry
+                    self._dirty.add(relative)
+                self.updated = time.time()
+
+    # Snapshot
+
+    def _connect(self) -> sqlite3.Connection:
+        snapshot_dir = os.path.dirname(self.snapshot_path)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        connection = sqlite3.connect(self.snapshot_path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, kind TEXT, first_line TEXT, heading TEXT)"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return connection
+
+    def load_snapshot(self) -> bool:
+        """Load the entries saved for this data directory; False if there are none."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT path, size, mtime, kind, first_line, heading FROM files").fetchall()
+            root = connection.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+        finally:
+            connection.close()
+        if root is None or root[0] != self.root:
+            return False
+        with self._lock:
+            self.entries = {row[0]: tuple(row[1:]) for row in rows}
+        return True
+
+    def clear_snapshot(self):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM files")
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (self.root,))
+        finally:
+            connection.close()
+
+    def save_snapshot(self):
+        """Write the entries changed since the last save."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            changes = [(relative, self.entries.get(relative)) for relative in dirty]
+        if not changes:
+            return
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (self.root,))
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('updated', ?)", (str(self.updated),))
+                connection.executemany("DELETE FROM files WHERE path = ?", [(r,) for r, entry in changes if entry is None])
+                connection.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                    [(r, *entry) for r, entry in changes if entry is not None],
+                )
+        except sqlite3.Error as e:
+            logger.warning("Could not save the data index snapshot: %s", e)
+            with self._lock:
+                self._dirty |= dirty
+        finally:
+            connection.close()
+
+    # Background maintenance
+
+    async def start(self):
+        if not await asyncio.to_thread(self.load_snapshot) and self.snapshot_path:
+            await asyncio.to_thread(self.clear_snapshot)
+        await asyncio.to_thread(self.scan)
+        if WATCH_MODE != "poll" and watchfiles is not None:
+            self.mode = "watch"
+            self._tasks.append(asyncio.create_task(self._watch()))
+        else:
+            self.mode = "poll"
+            self._tasks.append(asyncio.create_task(self._poll()))
+        self._tasks.append(asyncio.create_task(self._snapshot_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.to_thread(self.save_snapshot)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            await asyncio.to_thread(self.scan)
+
+    async def _watch(self):
+        # The data directory may not exist yet (it is created by the first task), and may be removed
+        # and recreated; rescan and start watching again whenever that happens.
+        while True:
+            if not os.path.isdir(self.root):
+                await asyncio.sleep(POLL_INTERVAL)
+                await asyncio.to_thread(self.scan)
+                continue
+            try:
+                await asyncio.to_thread(self.scan)
+                async for changes in watchfiles.awatch(self.root, debounce=50, step=20, recursive=True):
+                    await asyncio.to_thread(self.apply_changes, {path for _, path in changes})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Data directory watcher stopped (%s); restarting", e)
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            if self._dirty:
+                await asyncio.to_thread(self.save_snapshot)
+
+    # Queries
+
+    def files(self, prefix: str = "", kind: str = None, pattern: str = None, sort: str = "path",
+              descending: bool = False, limit: int = None, recursive: bool = True) -> list:
+        """Entries under `prefix` as dicts with a /data path, optionally filtered by kind (extension) and glob."""
+        scope = _relative(prefix)
+        scope = scope.rstrip("/") + "/" if scope else ""
+        with self._lock:
+            items = [(relative, entry) for relative, entry in self.entries.items() if relative.startswith(scope)]
+        if not recursive:
+            items = [(relative, entry) for relative, entry in items if "/" not in relative[len(scope):]]
+        if kind is not None:
+            items = [(relative, entry) for relative, entry in items if entry[KIND] == kind.lstrip(".").lower()]
+        if pattern is not None:
+            items = [(relative, entry) for relative, entry in items
+                     if fnmatch.fnmatch(relative, _relative(pattern)) or fnmatch.fnmatch(os.path.basename(relative), pattern)]
+        if sort == "path":
+            items.sort(key=lambda item: item[0], reverse=descending)
+        else:
+            field = FIELDS.index(sort)
+            items.sort(key=lambda item: (item[1][field] is None, item[1][field] if item[1][field] is not None else 0), reverse=descending)
+        if limit is not None:
+            items = items[:limit]
+        return [{"path": "/data/" + relative, **dict(zip(FIELDS, entry))} for relative, entry in items]
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = len(self.entries)
+            total = sum(entry[SIZE] for entry in self.entries.values())
+        return {"files": count, "bytes": total, "mode": self.mode, "updated": self.updated, "root": self.root}
+
+
+def _relative(path: str) -> str:
+    """A /data path (or a path already relative to the data directory) relative to the data directory."""
+    if path.startswith("/data"):
+        path = path[len("/data"):]
+    return path.lstrip("/")
+
+
+_index = None
+_snapshot_signature = None
+
+
+def get_index() -> DataIndex:
+    """
+    The live index when it runs in this process (the app). Elsewhere (e.g. executor workers) an
+    index loaded from the snapshot, reloaded whenever the snapshot changes.
+    """
+    global _index, _snapshot_signature
+    if _index is not None and _index.mode is not None:
+        return _index
+    root = os.path.realpath(get_data_dir())
+    signature = None
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(SNAPSHOT_PATH + suffix)
+            signature = (signature, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+    if _index is None or _index.root != root or signature != _snapshot_signature:
+        index = DataIndex(root, SNAPSHOT_PATH)
+        index.load_snapshot()
+        _index, _snapshot_signature = index, signature
+    return _index
+
+
+async def start():
+    global _index
+    _index = DataIndex(os.path.realpath(get_data_dir()), SNAPSHOT_PATH)
+    await _index.start()
+
+
+async def stop():
+    if _index is not None and _index.mode is not None:
+        await _index.stop()
+
+
+# Helpers for handlers and generated code. `refresh=True` re-stats the subtree first (reading only
+# files that changed), for callers that must see files written a moment ago.
+
+def files(prefix: str = "/data", kind: str = None, pattern: str = None, sort: str = "path",
+          descending: bool = False, limit: int = None, recursive: bool = True, refresh: bool = False) -> list:
+    index = get_index()
+    if refresh:
+        data_file_path(prefix)  # refuses paths outside the data directory
+        index.scan(_relative(prefix))
+    return index.files(prefix, kind, pattern, sort, descending, limit, recursive)
+
+
+def recent(count: int, prefix: str = "/data", kind: str = None, recursive: bool = True, refresh: bool = False) -> list:
+    """The `count` most recently modified files, newest first."""
+    return files(prefix, kind=kind, sort="mtime", descending=True, limit=count, recursive=recursive, refresh=refresh)
+
+
+def headings(prefix: str = "/data", refresh: bool = False) -> dict:
+    """First H1 of every Markdown file under `prefix`, keyed by path relative to `prefix`."""
+    scope = _relative(prefix).rstrip("/")
+    result = {}
+    for item in files(prefix, kind="md", refresh=refresh):
+        if item["heading"] is not None:
+            relative = _relative(item["path"])
+            result[relative[len(scope):].lstrip("/") if scope else relative] = item["heading"]
+    return result
+
+
+def glob(pattern: str) -> list:
+    """
+    Files matching `pattern` (see `DataIndex.files`), e.g. "/data/out/*.json" or "*.log". Unless a
+    watcher keeps the live index current, the directory the glob is anchored in (not all of /data)
+    is rescanned first.
+    """
+    anchor = []
+    for part in _relative(pattern).split("/")[:-1]:
+        if any(char in part for char in "*?["):
+            break
+        anchor.append(part)
+    return files("/data/" + "/".join(anchor), pattern=pattern, refresh=get_index().mode != "watch")
@@ -0,0 +1,38 @@
+import os
+
+
+def get_data_dir() -> str:
+    # Use the 'data' folder in the current working directory
+    return os.path.join(os.getcwd(), "data")
+
+def adjust_path(path: str) -> str:
+    """
+    If the provided path starts with '/data', adjust it to the actual data directory 
+    in the current working directory.
+    """
+    data_dir = get_data_dir()
+    if path.startswith("/data"):
+        # Use only the basename of the file and join with data_dir
+        filename = os.path.basename(path)
+        return os.path.join(data_dir, filename)
+    return path
+
+def is_path_allowed(path: str) -> bool:
+    """Ensure that the file path is within the data directory of the current working directory."""
+    data_dir = get_data_dir()
+    # Adjust path if necessary
+    adjusted_path = adjust_path(path)
+    full_path = os.path.realpath(adjusted_path)
+    return full_path.startswith(os.path.realpath(data_dir))
+
+def data_file_path(path: str) -> str:
+    """
+    Map a /data path into the data directory keeping its subdirectories (adjust_path keeps
+    only the basename), and refuse anything that resolves outside the data directory.
+    """
+    relative = path[len("/data"):].lstrip("/") if path.startswith("/data") else path
+    data_dir = os.path.realpath(get_data_dir())
+    full_path = os.path.realpath(os.path.join(data_dir, relative))
+    if full_path != data_dir and not full_path.startswith(data_dir + os.sep):
+        raise ValueError("Attempted to access outside of the data directory")
+    return full_path
@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+# numpy (and httpx, via http_client) are imported by the functions that use them: this module is
+# preloaded into the executor's fork server (see executor.PRELOAD_MODULES), which should not pay
+# for them until a task needs them.
+
+# Which embedder `embed_texts` uses by default: "hashing" (local, offline) or "openai".
+EMBEDDER = os.getenv("EMBEDDER", "hashing")
+EMBEDDINGS_DB = os.getenv("EMBEDDINGS_DB", os.path.join(".cache", "embeddings.sqlite3"))
+# Vectors are stored dense (4 bytes per feature per line), so this bounds memory as much as BLOCK_SIZE does.
+HASHING_FEATURES = int(os.getenv("EMBEDDINGS_HASHING_FEATURES", "1024"))
+LLM_URL = os.getenv("LLM_URL", "https://aiproxy.sanand.workers.dev/openai/v1/chat/completions")
+# Defaults to the /embeddings endpoint next to LLM_URL's /chat/completions.
+OPENAI_EMBEDDINGS_URL = os.getenv("OPENAI_EMBEDDINGS_URL")
+OPENAI_EMBEDDINGS_MODEL = os.getenv("OPENAI_EMBEDDINGS_MODEL", "text-embedding-3-small")
+# Rows (and columns) of the similarity matrix computed at once: memory stays at BLOCK_SIZE**2 floats.
+BLOCK_SIZE = int(os.getenv("EMBEDDINGS_BLOCK_SIZE", "2048"))
+EMBED_BATCH_SIZE = 512
+
+
+class HashingEmbedder:
+    """Local embedder: hashed word unigrams and bigrams with sublinear TF, L2-normalised. Needs no fitting."""
+
+    def __init__(self, n_features: int = HASHING_FEATURES):
+        self.name = f"hashing-{n_features}"
+        self.n_features = n_features
+        self._vectorizer = None
+
+    def embed(self, texts: list) -> "np.ndarray":
+        import numpy as np
+        if self._vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            self._vectorizer = HashingVectorizer(n_features=self.n_features, ngram_range=(1, 2), alternate_sign=False, norm=None)
+        counts = self._vectorizer.transform(texts)
+        counts.data = 1 + np.log(counts.data)
+        return normalize(counts.toarray().astype(np.float32))
+
+
+def openai_embeddings_url():
+    """OPENAI_EMBEDDINGS_URL, else the one derived from an OpenAI-style LLM_URL, else None."""
+    if OPENAI_EMBEDDINGS_URL:
+        return OPENAI_EMBEDDINGS_URL
+    base, _, endpoint = LLM_URL.rstrip("/").rpartition("/chat/")
+    return f"{base}/embeddings" if endpoint == "completions" else None
+
+
+class OpenAIEmbedder:
+    """OpenAI-compatible /embeddings endpoint (see `openai_embeddings_url`), authenticated with AIPROXY_TOKEN."""
+
+    def __init__(self, model: str = OPENAI_EMBEDDINGS_MODEL, url: str = None):
+        self.name = f"openai-{model}"
+        self.model = model
+        self.url = url or openai_embeddings_url()
+        if self.url is None:
+            raise ValueError("No embeddings endpoint: LLM_URL is not a chat/completions URL; set OPENAI_EMBEDDINGS_URL")
+
+    def embed(self, texts: list) -> "np.ndarray":
+        import numpy as np
+        import http_client
+        response = http_client.request_sync(
+            "POST",
+            self.url,
+            headers={"Authorization": f"Bearer {os.getenv('AIPROXY_TOKEN', '')}"},
+            json={"model": self.model, "input": texts},
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return normalize(np.array([item["embedding"] for item in data], dtype=np.float32))
+
+
+EMBEDDERS = {"hashing": HashingEmbedder, "openai": OpenAIEmbedder}
+_embedders = {}
+
+
+def get_embedder(name: str = None):
+    name = name or EMBEDDER
+    if name not in _embedders:
+        if name not in EMBEDDERS:
+            raise ValueError(f"Unknown embedder {name!r}; expected one of {', '.join(EMBEDDERS)}")
+        _embedders[name] = EMBEDDERS[name]()
+    return _embedders[name]
+
+
+def normalize(vectors: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class VectorCache:
+    """
+    Persistent vectors keyed by (embedder, sha256 of the text), so re-running a task over
+    a file only embeds lines that are new or changed. Safe to share between processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS vectors (embedder TEXT, hash TEXT, vector BLOB, PRIMARY KEY (embedder, hash))")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, embedder: str, hashes: list) -> dict:
+        import numpy as np
+        connection = self._connect()
+        found = {}
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            rows = connection.execute(
+                f"SELECT hash, vector FROM vectors WHERE embedder = ? AND hash IN ({','.join('?' * len(chunk))})",
+                [embedder, *chunk],
+            )
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, embedder: str, items: list):
+        import numpy as np
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO vectors (embedder, hash, vector) VALUES (?, ?, ?)",
+                [(embedder, text_hash, vector.astype(np.float32).tobytes()) for text_hash, vector in items],
+            )
+
+
+_cache = None
+
+
+def get_cache() -> VectorCache:
+    global _cache
+    if _cache is None:
+        _cache = VectorCache(EMBEDDINGS_DB)
+    return _cache
+
+
+def embed_texts(texts: list, embedder: str = None, use_cache: bool = True) -> "np.ndarray":
+    """L2-normalised float32 vectors for `texts`, one row per text, embedding only texts not already cached."""
+    import numpy as np
+    model = get_embedder(embedder)
+    hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in texts]
+    vectors = get_cache().get_many(model.name, list(set(hashes))) if use_cache else {}
+
+    missing = {}
+    for text_hash, text in zip(hashes, texts):
+        if text_hash not in vectors:
+            missing.setdefault(text_hash, text)
+    missing = list(missing.items())
+    for start in range(0, len(missing), EMBED_BATCH_SIZE):
+        batch = missing[start:start + EMBED_BATCH_SIZE]
+        embedded = model.embed([text for _, text in batch])
+        new = [(text_hash, vector) for (text_hash, _), vector in zip(batch, embedded)]
+        vectors.update(new)
+        if use_cache:
+            get_cache().put_many(model.name, new)
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([vectors[text_hash] for text_hash in hashes])
+
+
+def _merge_top(best_scores: "np.ndarray", best_rest: tuple, scores: "np.ndarray", rest: tuple, k: int):
+    """Keep the k highest scores (and their companion index arrays) of two candidate sets."""
+    import numpy as np
+    scores = np.concatenate([best_scores, scores])
+    rest = tuple(np.concatenate([a, b]) for a, b in zip(best_rest, rest))
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, rest = scores[keep], tuple(a[keep] for a in rest)
+    return scores, rest
+
+
+def top_k(queries: "np.ndarray", corpus: "np.ndarray", k: int = 5, block_size: int = None) -> tuple:
+    """
+    Cosine top-k of each query row against the corpus (both L2-normalised).
+    Returns (indices, scores), each of shape (len(queries), k), best first.
+    """
+    import numpy as np
+    block_size = block_size or BLOCK_SIZE
+    k = min(k, len(corpus))
+    indices = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+    for q_start in range(0, len(queries), block_size):
+        block = queries[q_start:q_start + block_size]
+        best_scores = np.full((len(block), 0), -np.inf, dtype=np.float32)
+        best_indices = np.zeros((len(block), 0), dtype=np.int64)
+        for c_start in range(0, len(corpus), block_size):
+            sims = block @ corpus[c_start:c_start + block_size].T
+            candidates = np.hstack([best_scores, sims])
+            candidate_indices = np.hstack([best_indices, np.broadcast_to(np.arange(c_start, c_start + sims.shape[1]), sims.shape)])
+            keep = np.argpartition(-candidates, k - 1, axis=1)[:, :k] if candidates.shape[1] > k else np.argsort(-candidates, axis=1)
+            best_scores = np.take_along_axis(candidates, keep, axis=1)
+            best_indices = np.take_along_axis(candidate_indices, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        scores[q_start:q_start + len(block)] = np.take_along_axis(best_scores, order, axis=1)
+        indices[q_start:q_start + len(block)] = np.take_along_axis(best_indices, order, axis=1)
+    return indices, scores
+
+
+def most_similar_pairs(vectors: "np.ndarray", k: int = 1, block_size: int = None) -> list:
+    """
+    The k most similar pairs (i, j, score) with i < j among L2-normalised rows, best first.
+    Only the upper triangle is computed, one block_size x block_size tile at a time.
+    """
+    import numpy as np
+    block_size = block_size or BLOCK_SIZE
+    n = len(vectors)
+    best_scores = np.zeros(0, dtype=np.float32)
+    best_pairs = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    for i_start in range(0, n, block_size):
+        rows = vectors[i_start:i_start + block_size]
+        for j_start in range(i_start, n, block_size):
+            sims = rows @ vectors[j_start:j_start + block_size].T
+            if j_start == i_start:
+                sims[np.tril_indices(len(rows), 0, sims.shape[1])] = -np.inf
+            flat = sims.ravel()
+            count = min(k, flat.size)
+            if count == 0:
+                continue
+            keep = np.argpartition(-flat, count - 1)[:count]
+            keep = keep[np.isfinite(flat[keep])]
+            i, j = np.unravel_index(keep, sims.shape)
+            best_scores, best_pairs = _merge_top(best_scores, best_pairs, flat[keep], (i + i_start, j + j_start), k)
+    order = np.argsort(-best_scores, kind="stable")
+    return [(int(best_pairs[0][o]), int(best_pairs[1][o]), float(best_scores[o])) for o in order]
+
+
+def most_similar_pair(texts: list, embedder: str = None) -> tuple:
+    """The two most similar texts, e.g. the most similar pair of comments in a file."""
+    pairs = most_similar_pairs(embed_texts(texts, embedder), k=1)
+    if not pairs:
+        raise ValueError("Need at least two texts to find a similar pair")
+    i, j, _ = pairs[0]
+    return texts[i], texts[j]
@@ -0,0 +1,282 @@
+import asyncio
+import contextlib
+import importlib
+import io
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+WORKERS = int(os.getenv("EXEC_WORKERS", str(os.cpu_count() or 2)))
+TASK_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "120"))
+MEMORY_LIMIT_MB = int(os.getenv("EXEC_MEMORY_LIMIT_MB", "2048"))
+MAX_TASKS_PER_WORKER = int(os.getenv("EXEC_MAX_TASKS_PER_WORKER", "50"))
+MAX_OUTPUT_CHARS = int(os.getenv("EXEC_MAX_OUTPUT_CHARS", "65536"))
+# Extra time the parent waits past TASK_TIMEOUT before it assumes a worker is wedged.
+KILL_GRACE = 5.0
+# After the first SIGALRM, how often it is raised again in case the code catches it.
+REALARM_INTERVAL = 1.0
+
+# Imported once in the fork server, so every worker (including recycled ones) starts with them loaded.
+PRELOAD_MODULES = ["os", "subprocess", "sqlite3", "json", "re", "datetime", "bs4", "markdown", "embeddings", "query_engine", "data_index", "media"]
+
+_pool = None
+_pool_tasks = 0
+_task_ids = itertools.count()
+_inflight = {}  # pool -> tasks awaiting an answer
+_wedged = set()  # pools retired because a worker stopped answering
+_task_pids = {}  # task id -> worker pid, as reported by the workers
+
+_base_globals = None
+_task_starts = None  # worker side: where each task reports (task id, pid) before running
+_alarmed = False
+
+
+class ExecutionTimeout(BaseException):
+    """A BaseException so that the `except Exception` blocks common in generated code don't swallow it."""
+
+
+def _on_alarm(signum, frame):
+    global _alarmed
+    _alarmed = True
+    signal.setitimer(signal.ITIMER_REAL, REALARM_INTERVAL)
+    raise ExecutionTimeout()
+
+
+def _init_worker(memory_limit_mb: int, task_starts):
+    """Runs once in each worker process: apply the memory limit and build the exec namespace."""
+    global _base_globals, _task_starts
+    _task_starts = task_starts
+    if memory_limit_mb > 0:
+        import resource
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    import sqlite3
+    import subprocess
+    from datetime import datetime
+    _base_globals = {"__builtins__": __builtins__, "os": os, "subprocess": subprocess, "sqlite3": sqlite3, "datetime": datetime}
+    try:
+        from bs4 import BeautifulSoup
+        _base_globals["BeautifulSoup"] = BeautifulSoup
+    except ImportError:
+        pass
+    try:
+        import markdown
+        _base_globals["markdown"] = markdown
+    except ImportError:
+        pass
+    try:
+        import embeddings
+        _base_globals["embeddings"] = embeddings
+    except ImportError:
+        pass
+    import query_engine
+    _base_globals["query_engine"] = query_engine
+    import data_index
+    _base_globals["data_index"] = data_index
+    import media
+    _base_globals["media"] = media
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= MAX_OUTPUT_CHARS:
+        return text
+    return text[:MAX_OUTPUT_CHARS] + f"\n... [truncated {len(text) - MAX_OUTPUT_CHARS} chars]"
+
+
+def _run(code: str, timeout: float, task_id: int) -> dict:
+    """Compile and exec `code` inside a worker, returning captured output and any error."""
+    global _alarmed
+    _task_starts.put((task_id, os.getpid()))
+    _alarmed = False
+    stdout, stderr = io.StringIO(), io.StringIO()
+    result = {"ok": True, "error_type": None, "error": None, "compile_seconds": None, "exec_seconds": None}
+    exec_globals = dict(_base_globals)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            compiled_code = compile(code, "<string>", "exec")
+            result["compile_seconds"] = time.perf_counter() - started
+            started = time.perf_counter()
+            exec(compiled_code, exec_globals, {})
+            result["exec_seconds"] = time.perf_counter() - started
+            if _alarmed:
+                # The code caught the timeout (e.g. a bare `except:`) and carried on.
+                raise ExecutionTimeout()
+    except SyntaxError as e:
+        result.update(ok=False, error_type="syntax", error=str(e))
+    except ExecutionTimeout:
+        result.update(ok=False, error_type="timeout", error=f"Execution exceeded {timeout:g}s")
+    except MemoryError:
+        result.update(ok=False, error_type="memory", error=f"Execution exceeded {MEMORY_LIMIT_MB} MB")
+    except BaseException as e:
+        stderr.write(traceback.format_exc())
+        result.update(ok=False, error_type="runtime", error=str(e))
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    result["stdout"] = _truncate(stdout.getvalue())
+    result["stderr"] = _truncate(stderr.getvalue())
+    return result
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _new_pool() -> ProcessPoolExecutor:
+    # forkserver rather than fork: the parent runs an event loop and threads. Only the modules
+    # workers need are preloaded, not "__main__" (see `submit`).
+    # Workers are recycled by replacing the whole pool (see `_recycle_pool`), not with
+    # max_tasks_per_child, which can leave the pool waiting forever for a replacement worker
+    # on Python < 3.13 (CPython gh-115634), reliably so with a single worker.
+    global _pool_tasks
+    _pool_tasks = 0
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD_MODULES)
+    task_starts = context.SimpleQueue()
+    pool = ProcessPoolExecutor(
+        max_workers=WORKERS,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(MEMORY_LIMIT_MB, task_starts),
+    )
+    pool.task_starts = task_starts
+    return pool
+
+
+def submit(pool: ProcessPoolExecutor, fn, *args):
+    """
+    Submit to a forkserver `pool` (this one or the media pool), which starts worker processes on
+    demand, with __main__'s path and spec hidden: otherwise every worker re-imports the parent's main
+    script (app.py and its module-level setup) as __mp_main__, which fails outright when the app was
+    not started from a file. Returns an asyncio future.
+    """
+    main = sys.modules["__main__"]
+    saved = {name: main.__dict__[name] for name in ("__file__", "__spec__") if name in main.__dict__}
+    main.__dict__.pop("__file__", None)
+    main.__spec__ = None
+    try:
+        return asyncio.wrap_future(pool.submit(fn, *args))
+    finally:
+        main.__dict__.update(saved)
+
+
+def _prewarm(pool: ProcessPoolExecutor) -> list:
+    """Start every worker of `pool` now with a no-op task, so real tasks don't pay for process start-up."""
+    futures = [submit(pool, _ping) for _ in range(WORKERS)]
+    for future in futures:
+        # Not awaited when warming a replacement pool; if it breaks, the next real task reports it.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return futures
+
+
+def _replace_pool() -> ProcessPoolExecutor:
+    global _pool
+    _pool = _new_pool()
+    _prewarm(_pool)
+    return _pool
+
+
+def _recycle_pool():
+    """Swap in a fresh pool once the current one has run its task budget; queued and running tasks still finish."""
+    if _pool is None or not MAX_TASKS_PER_WORKER or _pool_tasks < WORKERS * MAX_TASKS_PER_WORKER:
+        return
+    old_pool = _pool
+    _replace_pool()
+    old_pool.shutdown(wait=False)
+
+
+async def start():
+    """Create the pool and prewarm every worker so the first task does not pay for process start-up."""
+    global _pool
+    if _pool is None:
+        _pool = _new_pool()
+    await asyncio.gather(*_prewarm(_pool))
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def _collect_task_pids(pool: ProcessPoolExecutor):
+    while not pool.task_starts.empty():
+        task_id, pid = pool.task_starts.get()
+        _task_pids[task_id] = pid
+
+
+def _retire_wedged(pool: ProcessPoolExecutor, task_id: int):
+    """
+    Send new tasks to a fresh pool and stop the worker stuck on `task_id` (code stuck in C ignores
+    SIGALRM). Killing a worker breaks every pending future of its pool, so the stopped worker is only
+    killed once the other tasks already running in the old pool have finished (see `_reap`).
+    """
+    if _pool is pool:
+        _replace_pool()
+    _wedged.add(pool)
+    _collect_task_pids(pool)
+    pid = _task_pids.get(task_id)
+    if pid is not None:
+        with contextlib.suppress(ProcessLookupError):
+            os.kill(pid, signal.SIGSTOP)
+
+
+def _reap(pool: ProcessPoolExecutor):
+    if _inflight.get(pool) or pool not in _wedged:
+        return
+    _wedged.discard(pool)
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_code(code: str, timeout: float = None) -> dict:
+    """
+    Execute code in a pooled worker process. Returns a dict with "ok", "error_type", "error",
+    "stdout", "stderr" and the worker-side "compile_seconds"/"exec_seconds" (None if not reached). A soft timeout (SIGALRM) interrupts Python code inside the worker;
+    if the worker does not answer within KILL_GRACE seconds after that, it is stopped and later killed (see `_retire_wedged`).
+    """
+    global _pool, _pool_tasks
+    if _pool is None:
+        _replace_pool()
+    pool = _pool
+    _pool_tasks += 1
+    task_id = next(_task_ids)
+    _inflight[pool] = _inflight.get(pool, 0) + 1
+    timeout = timeout or TASK_TIMEOUT
+    try:
+        return await asyncio.wait_for(submit(pool, _run, code, timeout, task_id), timeout + KILL_GRACE)
+    except asyncio.TimeoutError:
+        _retire_wedged(pool, task_id)
+        return {"ok": False, "error_type": "timeout", "error": f"Execution exceeded {timeout:g}s; worker killed",
+                "stdout": "", "stderr": "", "compile_seconds": None, "exec_seconds": None}
+    except BrokenProcessPool:
+        if _pool is pool:
+            _replace_pool()
+        return {"ok": False, "error_type": "crash", "error": "Worker process died while executing code",
+                "stdout": "", "stderr": "", "compile_seconds": None, "exec_seconds": None}
+    finally:
+        _inflight[pool] -= 1
+        if not _inflight[pool]:
+            del _inflight[pool]
+        _collect_task_pids(pool)
+        _task_pids.pop(task_id, None)
+        _reap(pool)
+        # Recycling once a task finishes (not when the next arrives) lets the new pool warm up in between.
+        _recycle_pool()
@@ -0,0 +1,334 @@
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import tarfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = int(os.getenv("READ_CHUNK_SIZE", str(64 * 1024)))
+# Files smaller than this are not worth the CPU of compressing.
+COMPRESS_MIN_SIZE = int(os.getenv("READ_COMPRESS_MIN_SIZE", "1024"))
+# Bulk reads: most files per request, and largest file inlined in an NDJSON response (use tar beyond that).
+BULK_MAX_FILES = int(os.getenv("READ_BULK_MAX_FILES", "1000"))
+BULK_INLINE_MAX_SIZE = int(os.getenv("READ_BULK_INLINE_MAX_SIZE", str(16 * 1024 * 1024)))
+HASH_CACHE_ENTRIES = int(os.getenv("READ_HASH_CACHE_ENTRIES", "4096"))
+MANIFEST_NAME = ".manifest.json"
+
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/xml", "application/javascript", "application/x-ndjson",
+    "application/sql", "image/svg+xml",
+}
+
+mimetypes.add_type("text/markdown", ".md")
+mimetypes.add_type("text/plain", ".log")
+mimetypes.add_type("application/x-ndjson", ".jsonl")
+
+
+def guess_media_type(path: str) -> str:
+    """Guess the content type from the extension, falling back to sniffing the first block."""
+    media_type, _ = mimetypes.guess_type(path)
+    if media_type is None:
+        with open(path, "rb") as f:
+            head = f.read(1024)
+        try:
+            head.decode("utf-8")
+            media_type = "text/plain"
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the block is still text.
+            media_type = "text/plain" if e.start >= len(head) - 3 else "application/octet-stream"
+    if media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES:
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+def is_compressible(media_type: str) -> bool:
+    base = media_type.split(";")[0]
+    return base.startswith("text/") or base in COMPRESSIBLE_TYPES
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0, or None for identity."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.strip().lower()] = q
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    for name in candidates:
+        if offered.get(name, offered.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+def parse_range(range_header: str, size: int):
+    """
+    Parse a single-range "bytes=" header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored (malformed, e.g. "bytes=5-2", or multi-range)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start and last:
+                return None
+    except ValueError:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def iter_file(path: str, start: int = 0, length: int = None):
+    """Yield the file in CHUNK_SIZE blocks, so memory per request stays bounded."""
+    io_seconds = 0.0
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                started = time.perf_counter()
+                chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                io_seconds += time.perf_counter() - started
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+    finally:
+        # Only time spent reading is counted, not time waiting on a slow client.
+        metrics.observe("read_io", io_seconds)
+
+
+def iter_compressed(chunks, encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=4)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if out:
+                yield out
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def file_response(request: Request, path: str) -> Response:
+    """
+    Serve `path` honouring conditional requests (ETag/Last-Modified), single byte ranges and
+    gzip/br compression. Bodies are streamed, and plain full-file responses go through FileResponse
+    so servers that support zero-copy sends can use them.
+    """
+    st = os.stat(path)
+    identity_etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    media_type = guess_media_type(path)
+    headers = {
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+
+    # Ranges are served from the identity encoding, so If-Range is checked against its ETag.
+    byte_range = None
+    unsatisfiable = False
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() in (identity_etag, headers["Last-Modified"])):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            unsatisfiable = True
+
+    encoding = None
+    if byte_range is None and not unsatisfiable and st.st_size >= COMPRESS_MIN_SIZE and is_compressible(media_type):
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    # Each encoding is a different representation, so it gets its own ETag.
+    headers["ETag"] = f'"{st.st_mtime_ns:x}-{st.st_size:x}-{encoding}"' if encoding else identity_etag
+    if is_not_modified(request, headers["ETag"], st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    if unsatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(iter_file(path, start, end - start + 1), status_code=206,
+                                 media_type=media_type, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        return StreamingResponse(iter_compressed(iter_file(path), encoding), media_type=media_type, headers=headers)
+    if range_header:
+        # An ignored Range header (malformed, multi-range or stale If-Range): FileResponse would act on it itself.
+        headers["Content-Length"] = str(st.st_size)
+        return StreamingResponse(iter_file(path), media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+# Bulk reads: many files in one response, each with its size and SHA-256.
+
+_hashes = OrderedDict()  # path -> (signature, sha256)
+_hashes_lock = threading.Lock()
+
+
+def _signature(st: os.stat_result) -> tuple:
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _remember_hash(path: str, signature: tuple, digest: str):
+    with _hashes_lock:
+        _hashes[path] = (signature, digest)
+        _hashes.move_to_end(path)
+        while len(_hashes) > HASH_CACHE_ENTRIES:
+            _hashes.popitem(last=False)
+
+
+def file_sha256(path: str, st: os.stat_result = None) -> str:
+    """SHA-256 of the file, remembered until its inode, mtime or size changes."""
+    signature = _signature(st or os.stat(path))
+    with _hashes_lock:
+        cached = _hashes.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.sha256()
+    for chunk in iter_file(path):
+        digest.update(chunk)
+    _remember_hash(path, signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def manifest_entry(name: str, path: str, with_hash: bool = True) -> dict:
+    """Metadata for one requested file; `path` is None when it was missing or not allowed."""
+    try:
+        if path is None:
+            raise FileNotFoundError(name)
+        st = os.stat(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(name)
+        entry = {"path": name, "size": st.st_size, "mtime": st.st_mtime, "media_type": guess_media_type(path).split(";")[0]}
+        if with_hash:
+            entry["sha256"] = file_sha256(path, st)
+        return entry
+    except OSError:
+        return {"path": name, "error": "File not found."}
+
+
+def iter_ndjson(targets: list):
+    """One JSON line per file: its metadata plus `content` (UTF-8 text) or `content_base64`."""
+    for name, path in targets:
+        entry = manifest_entry(name, path, with_hash=False)
+        if "error" not in entry:
+            if entry["size"] > BULK_INLINE_MAX_SIZE:
+                entry = {"path": name, "size": entry["size"], "error": "File too large for ndjson; use format=tar."}
+            else:
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    entry["size"] = len(data)
+                    entry["sha256"] = hashlib.sha256(data).hexdigest()
+                    try:
+                        entry["content"] = data.decode("utf-8")
+                    except UnicodeDecodeError:
+                        entry["content_base64"] = base64.b64encode(data).decode("ascii")
+                except OSError:
+                    entry = {"path": name, "error": "File not found."}
+        yield (json.dumps(entry) + "\n").encode("utf-8")
+
+
+def _tar_header(member: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(member)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int) -> bytes:
+    return b"\0" * (-size % tarfile.BLOCKSIZE)
+
+
+def iter_tar(targets: list, data_dir: str):
+    """
+    An uncompressed tar stream of the files (named relative to /data), written block by block so
+    memory stays bounded, ending with MANIFEST_NAME: the metadata and SHA-256 computed while reading.
+    """
+    manifest = []
+    for name, path in targets:
+        try:
+            if path is None:
+                raise FileNotFoundError(name)
+            st = os.stat(path)
+        except OSError:
+            manifest.append({"path": name, "error": "File not found."})
+            continue
+        member = os.path.relpath(os.path.realpath(path), data_dir)
+        yield _tar_header(member, st.st_size, st.st_mtime)
+        digest = hashlib.sha256()
+        written = 0
+        for chunk in iter_file(path, 0, st.st_size):
+            digest.update(chunk)
+            written += len(chunk)
+            yield chunk
+        entry = {"path": name, "member": member, "size": st.st_size, "mtime": st.st_mtime, "sha256": digest.hexdigest()}
+        if written < st.st_size:
+            # The file shrank while being sent; the header's size has to be honoured.
+            yield b"\0" * (st.st_size - written)
+            entry["error"] = "File changed while reading."
+        else:
+            _remember_hash(path, _signature(st), entry["sha256"])
+        yield _tar_padding(st.st_size)
+        manifest.append(entry)
+    body = json.dumps({"files": manifest}, indent=2).encode("utf-8")
+    yield _tar_header(MANIFEST_NAME, len(body), time.time())
+    yield body + _tar_padding(len(body))
+    yield b"\0" * (2 * tarfile.BLOCKSIZE)
@@ -0,0 +1,318 @@
+import asyncio
+import email
+import email.policy
+import inspect
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from email.utils import parseaddr
+
+import data_index
+import embeddings
+import media
+import metrics
+import query_engine
+from data_paths import data_file_path
+
+ENABLED = os.getenv("NATIVE_HANDLERS", "1") != "0"
+
+# A /data path as it appears in task text, without trailing sentence punctuation.
+DATA_PATH = re.compile(r"/data(?:/[\w\-.]*[\w\-]|/)*/?")
+
+WEEKDAYS = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6}
+
+# The formats the date task families use (see the "dates" prompt section), plus a few close variants.
+DATE_FORMATS = [
+    "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y/%m/%d",
+    "%d-%b-%Y", "%d %b %Y", "%b %d, %Y", "%B %d, %Y", "%d-%B-%Y",
+]
+
+
+class HandlerError(Exception):
+    pass
+
+
+def data_paths_in(task: str) -> list:
+    """All /data paths mentioned in the task, in order of appearance and without repeats."""
+    paths = []
+    for path in DATA_PATH.findall(task):
+        if path != "/data/" and path != "/data" and path not in paths:
+            paths.append(path)
+    return paths
+
+
+def _write_text(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def parse_date(value: str) -> datetime:
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise HandlerError(f"Unrecognised date: {value!r}")
+
+
+# Count weekdays in a list of dates, e.g. "Count the number of Wednesdays in /data/dates.txt
+# and write just the number to /data/dates-wednesdays.txt".
+
+def parse_count_weekday(task: str):
+    weekday = re.search(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)s?\b", task, re.IGNORECASE)
+    paths = data_paths_in(task)
+    if not weekday or len(paths) != 2 or not re.search(r"\bcount\b|\bnumber of\b|\bhow many\b|#", task, re.IGNORECASE):
+        return None
+    return {"weekday": weekday.group(1).lower(), "source": paths[0], "output": paths[1]}
+
+
+def count_weekday(weekday: str, source: str, output: str) -> dict:
+    target = WEEKDAYS[weekday]
+    count = 0
+    with open(data_file_path(source), "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and parse_date(line).weekday() == target:
+                count += 1
+    _write_text(data_file_path(output), str(count))
+    return {"count": count, "output": output}
+
+
+# Extract the sender's address from an email message.
+
+def parse_email_sender(task: str):
+    paths = data_paths_in(task)
+    if len(paths) != 2 or not re.search(r"\bsender'?s?\b", task, re.IGNORECASE) or not re.search(r"\bemail\b", task, re.IGNORECASE):
+        return None
+    return {"source": paths[0], "output": paths[1]}
+
+
+def email_sender(source: str, output: str) -> dict:
+    with open(data_file_path(source), "r", encoding="utf-8") as f:
+        message = email.message_from_file(f, policy=email.policy.compat32)
+    _, address = parseaddr(message.get("From", ""))
+    if not address:
+        raise HandlerError("No From header in the message")
+    _write_text(data_file_path(output), address)
+    return {"sender": address, "output": output}
+
+
+# First lines of the N most recently modified .log files, most recent first.
+
+def parse_recent_logs(task: str):
+    match = re.search(r"first line.*?\b(\d+)\s+most recent\s+\.?log\b", task, re.IGNORECASE | re.DOTALL)
+    paths = data_paths_in(task)
+    if not match or len(paths) != 2:
+        return None
+    return {"count": int(match.group(1)), "directory": paths[0], "output": paths[1]}
+
+
+def recent_logs(count: int, directory: str, output: str) -> dict:
+    # The index holds each file's mtime and first line; refreshing it only re-reads files that changed.
+    entries = data_index.recent(count, directory, kind="log", recursive=False, refresh=True)
+    lines = [entry["first_line"] or "" for entry in entries]
+    _write_text(data_file_path(output), "".join(line + "\n" for line in lines))
+    return {"files": len(lines), "output": output}
+
+
+# Index of the first H1 of every Markdown file under a directory.
+
+def parse_markdown_index(task: str):
+    if not re.search(r"markdown|\.md\b", task, re.IGNORECASE) or not re.search(r"\bH1\b|\btitle", task, re.IGNORECASE):
+        return None
+    paths = data_paths_in(task)
+    directories = [path for path in paths if path.endswith("/")]
+    outputs = [path for path in paths if path.endswith(".json")]
+    if len(directories) != 1 or len(outputs) != 1:
+        return None
+    return {"directory": directories[0], "output": outputs[0]}
+
+
+def markdown_index(directory: str, output: str) -> dict:
+    index = data_index.headings(directory, refresh=True)
+    output_path = data_file_path(output)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    return {"files": len(index), "output": output}
+
+
+# Total sales (units * price) of one ticket type in a SQLite database.
+
+def parse_ticket_sales(task: str):
+    ticket_type = re.search(r"[\"“'‘]([\w\s-]+)[\"”'’]\s+ticket type", task, re.IGNORECASE)
+    paths = data_paths_in(task)
+    databases = [path for path in paths if path.endswith(".db")]
+    outputs = [path for path in paths if not path.endswith(".db")]
+    if not ticket_type or not re.search(r"\btotal sales\b", task, re.IGNORECASE) or len(databases) != 1 or len(outputs) != 1:
+        return None
+    table = re.search(r"\bhas an? (\w+) (?:table )?with columns\b", task, re.IGNORECASE)
+    return {"database": databases[0], "table": table.group(1) if table else "tickets",
+            "ticket_type": ticket_type.group(1), "output": outputs[0]}
+
+
+def ticket_sales(database: str, table: str, ticket_type: str, output: str) -> dict:
+    if not re.fullmatch(r"\w+", table):
+        raise HandlerError(f"Unexpected table name: {table!r}")
+    total = query_engine.scalar(database, f"SELECT SUM(units * price) FROM {table} WHERE type = ?", (ticket_type,))
+    _write_text(data_file_path(output), str(total or 0))
+    return {"total": total or 0, "output": output}
+
+
+# Format a file in place with prettier.
+
+def parse_prettier(task: str):
+    version = re.search(r"prettier@([\w.\-]+[\w])", task, re.IGNORECASE)
+    paths = data_paths_in(task)
+    if not re.search(r"\bprettier\b", task, re.IGNORECASE) or len(paths) != 1:
+        return None
+    return {"path": paths[0], "version": version.group(1) if version else None}
+
+
+async def prettier(path: str, version: str = None) -> dict:
+    file_path = data_file_path(path)
+    if not os.path.isfile(file_path):
+        raise HandlerError(f"{path} does not exist")
+    if version:
+        command = ["npx", "--yes", f"prettier@{version}", "--write", file_path]
+    else:
+        command = [shutil.which("prettier") or "prettier", "--write", file_path]
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise HandlerError(f"prettier failed: {stderr.decode('utf-8', 'replace')}")
+    return {"output": path}
+
+
+# The most similar pair of lines (e.g. comments) by embedding similarity, written one per line.
+
+def similar_pair_embedder():
+    """
+    The task asks for semantic embeddings, so the handler only takes it with an embedder named in
+    EMBEDDER, or the OpenAI embedder when a token and an embeddings endpoint (see
+    embeddings.openai_embeddings_url) are configured; otherwise it goes to the LLM.
+    """
+    if os.getenv("EMBEDDER"):
+        return os.getenv("EMBEDDER")
+    return "openai" if os.getenv("AIPROXY_TOKEN") and embeddings.openai_embeddings_url() else None
+
+
+def parse_similar_pair(task: str):
+    paths = data_paths_in(task)
+    if not re.search(r"\bmost similar\b.*\bpair\b|\bpair\b.*\bmost similar\b", task, re.IGNORECASE | re.DOTALL) or len(paths) != 2:
+        return None
+    embedder = similar_pair_embedder()
+    if embedder is None:
+        return None
+    return {"source": paths[0], "output": paths[1], "embedder": embedder}
+
+
+def similar_pair(source: str, output: str, embedder: str = None) -> dict:
+    # embeddings only imports numpy and scikit-learn the first time this task family comes up.
+    with open(data_file_path(source), "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    try:
+        pair = embeddings.most_similar_pair(lines, embedder)
+    except ValueError as e:
+        raise HandlerError(str(e))
+    _write_text(data_file_path(output), "\n".join(sorted(pair)) + "\n")
+    return {"lines": len(lines), "output": output}
+
+
+# Transcribe an audio file, in parallel chunks in the media pool.
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac", ".ogg", ".m4a")
+
+
+def parse_transcribe_audio(task: str):
+    paths = data_paths_in(task)
+    audio = [path for path in paths if path.lower().endswith(AUDIO_EXTENSIONS)]
+    outputs = [path for path in paths if path not in audio]
+    if not re.search(r"\btranscri", task, re.IGNORECASE) or len(audio) != 1 or len(outputs) != 1:
+        return None
+    # Without ffmpeg or a speech model the generated code may still manage (e.g. with another library).
+    if not media.transcription_available():
+        return None
+    return {"source": audio[0], "output": outputs[0]}
+
+
+async def transcribe_audio(source: str, output: str) -> dict:
+    result = await media.transcribe(source, output)
+    return {"backend": result["backend"], "chunks": result["chunks"], "cached": result["cached"], "output": output}
+
+
+# Resize and/or compress an image into another file.
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp", ".tiff")
+SIZE_UNITS = {"b": 1, "byte": 1, "bytes": 1, "kb": 1024, "mb": 1024 * 1024}
+
+
+def parse_resize_image(task: str):
+    paths = data_paths_in(task)
+    images = [path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)]
+    if not re.search(r"\b(?:compress|resiz|shrink|scale)", task, re.IGNORECASE) or len(images) != 2 or len(paths) != 2:
+        return None
+    lossless = re.search(r"\blossless", task, re.IGNORECASE)
+    if lossless and not images[1].lower().endswith(".png"):
+        return None
+    params = {"source": images[0], "output": images[1]}
+    size = re.search(r"\b(\d{1,5})\s*[x×]\s*(\d{1,5})\b", task)
+    width = re.search(r"\bwidth (?:of |to )?(\d{1,5})\b", task, re.IGNORECASE)
+    height = re.search(r"\bheight (?:of |to )?(\d{1,5})\b", task, re.IGNORECASE)
+    percent = re.search(r"\b(?:resize|scale)\w*\b.*?\b(\d{1,3})\s*%", task, re.IGNORECASE)
+    max_size = re.search(r"\b(?:under|below|less than|at most|smaller than)\s+(\d+(?:\.\d+)?)\s*(kb|mb|bytes?|b)\b", task, re.IGNORECASE)
+    quality = re.search(r"\bquality (?:of |to )?(\d{1,3})\b", task, re.IGNORECASE)
+    if size:
+        params["width"], params["height"] = int(size.group(1)), int(size.group(2))
+    else:
+        if width:
+            params["width"] = int(width.group(1))
+        if height:
+            params["height"] = int(height.group(1))
+        if percent and not width and not height:
+            params["scale"] = int(percent.group(1)) / 100
+    if max_size:
+        params["max_bytes"] = int(float(max_size.group(1)) * SIZE_UNITS[max_size.group(2).lower()])
+    if quality and not lossless:
+        params["quality"] = int(quality.group(1))
+    return params
+
+
+async def resize_image(source: str, output: str, **options) -> dict:
+    result = await media.resize_image(source, output, **options)
+    return {key: result[key] for key in ("width", "height", "bytes", "cached", "output")}
+
+
+# (name, parse, run): `parse(task)` returns the keyword arguments for `run`, or None if the task is not in the family.
+HANDLERS = [
+    ("count_weekday", parse_count_weekday, count_weekday),
+    ("email_sender", parse_email_sender, email_sender),
+    ("recent_logs", parse_recent_logs, recent_logs),
+    ("markdown_index", parse_markdown_index, markdown_index),
+    ("ticket_sales", parse_ticket_sales, ticket_sales),
+    ("prettier", parse_prettier, prettier),
+    ("similar_pair", parse_similar_pair, similar_pair),
+    ("transcribe_audio", parse_transcribe_audio, transcribe_audio),
+    ("resize_image", parse_resize_image, resize_image),
+]
+
+
+def match(task: str):
+    """Return (name, run, params) for the first handler that recognises the task, or None."""
+    if not ENABLED:
+        return None
+    for name, parse, run in HANDLERS:
+        params = parse(task)
+        if params is not None:
+            return name, run, params
+    return None
+
+
+async def run(handler, params: dict) -> dict:
+    with metrics.span("handler"):
+        if inspect.iscoroutinefunction(handler):
+            return await handler(**params)
+        return await asyncio.to_thread(handler, **params)
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import random
+
+import httpx
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "16"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client = None
+_semaphore = None
+_loop = None  # the loop the shared client belongs to
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive client, creating it on first use."""
+    global _client, _semaphore, _loop
+    if _client is None:
+        _loop = asyncio.get_running_loop()
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENCY * 2, max_keepalive_connections=MAX_CONCURRENCY),
+            follow_redirects=True,
+        )
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _client
+
+
+async def close():
+    global _client, _semaphore, _loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+    _loop = None
+
+
+def _backoff(attempt: int, response: httpx.Response = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header when present."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client. At most MAX_CONCURRENCY upstream calls run at once;
+    429/5xx responses and transport errors are retried up to MAX_RETRIES times with jittered backoff.
+    The concurrency slot is released while backing off so waiting retries do not block other calls.
+    """
+    client = get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with _semaphore:
+                response = await client.request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _backoff(attempt)
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            delay = _backoff(attempt, response)
+        await asyncio.sleep(delay)
+
+
+def request_sync(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    `request` for blocking code. From a worker thread of the app (e.g. asyncio.to_thread) the call
+    runs on the app's loop, sharing its client, concurrency limit and retries; in a process without
+    one (e.g. an executor worker) it runs on a short-lived client with the same retries.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("request_sync would block the event loop; await request() instead")
+    if _loop is not None and _loop.is_running():
+        return asyncio.run_coroutine_threadsafe(request(method, url, **kwargs), _loop).result()
+
+    async def once():
+        try:
+            return await request(method, url, **kwargs)
+        finally:
+            await close()
+
+    return asyncio.run(once())
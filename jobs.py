@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from queue import Empty, SimpleQueue
+
+# Finished jobs are kept this long so clients can still poll their result.
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "3600"))
+
+TERMINAL = ("succeeded", "failed")
+COLUMNS = ("id", "task", "lane", "status", "stage", "result", "error", "status_code", "created", "started", "finished")
+
+logger = logging.getLogger("app.jobs")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("id", "task", "lane", "status", "stage", "result", "error", "status_code",
+                 "created", "started", "finished", "changed")
+
+    def __init__(self, task: str, lane: str, job_id: str = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.task = task
+        self.lane = lane
+        self.status = "queued"
+        self.stage = "queued"
+        self.result = None
+        self.error = None
+        self.status_code = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.changed = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id, "task": self.task, "lane": self.lane, "status": self.status, "stage": self.stage,
+            "result": self.result, "error": self.error, "status_code": self.status_code,
+            "created": self.created, "started": self.started, "finished": self.finished,
+        }
+
+
+class JobScheduler:
+    """
+    Runs queued tasks with a fixed number of workers per lane. Each lane has its own bounded queue;
+    `submit` raises QueueFull instead of letting the backlog grow without limit. When `db_path` is set,
+    every job is mirrored to SQLite by a writer thread (so commits never block the event loop); on
+    start, unfinished jobs are requeued and finished ones within JOB_RETENTION can still be polled.
+    """
+
+    def __init__(self, runner, workers: dict, max_depth: dict, db_path: str = None):
+        self.runner = runner
+        self.workers = workers
+        self.max_depth = max_depth
+        self._queues = {lane: asyncio.Queue() for lane in workers}
+        self._jobs = {}
+        self._tasks = []
+        self._db = None
+        self._writes = SimpleQueue()  # (sql, params) for the writer thread; None stops it
+        self._writer = None
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, task TEXT, lane TEXT, status TEXT, stage TEXT, "
+                "result TEXT, error TEXT, status_code INTEGER, created REAL, started REAL, finished REAL)"
+            )
+            self._db.commit()
+
+    async def start(self):
+        if self._db is not None:
+            for row in await asyncio.to_thread(self._load):
+                job = Job(row["task"], row["lane"], row["id"])
+                job.created = row["created"]
+                if row["status"] in TERMINAL:
+                    for name in ("status", "stage", "error", "status_code", "started", "finished"):
+                        setattr(job, name, row[name])
+                    job.result = json.loads(row["result"]) if row["result"] else None
+                    self._jobs[job.id] = job
+                elif row["lane"] in self._queues:
+                    self._jobs[job.id] = job
+                    self._save(job)
+                    self._queues[job.lane].put_nowait(job)
+            self._writer = threading.Thread(target=self._write_loop, name="jobs-db", daemon=True)
+            self._writer.start()
+        for lane, count in self.workers.items():
+            self._tasks += [asyncio.create_task(self._worker(lane)) for _ in range(count)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._writer is not None:
+            self._writes.put(None)
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+
+    def submit(self, task: str, lane: str) -> Job:
+        self._prune()
+        queue = self._queues[lane]
+        if queue.qsize() >= self.max_depth[lane]:
+            raise QueueFull(f"The {lane} queue is full ({self.max_depth[lane]} jobs waiting). Retry later.")
+        job = Job(task, lane)
+        self._jobs[job.id] = job
+        self._save(job)
+        queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def depths(self) -> dict:
+        return {lane: queue.qsize() for lane, queue in self._queues.items()}
+
+    async def watch(self, job_id: str):
+        """Yield the job's state now and after every change, finishing once it succeeds or fails."""
+        job = self._jobs.get(job_id)
+        while job is not None:
+            changed = job.changed
+            yield job.to_dict()
+            if job.status in TERMINAL:
+                return
+            await changed.wait()
+
+    def _update(self, job: Job, **fields):
+        for name, value in fields.items():
+            setattr(job, name, value)
+        self._save(job)
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    def _save(self, job: Job):
+        if self._db is None:
+            return
+        self._writes.put((
+            f"INSERT OR REPLACE INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            (job.id, job.task, job.lane, job.status, job.stage, json.dumps(job.result), job.error, job.status_code,
+             job.created, job.started, job.finished),
+        ))
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished is not None and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired and self._db is not None:
+            self._writes.put(("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,)))
+
+    def _load(self) -> list:
+        """Drop jobs that finished before JOB_RETENTION and return the rest, oldest first."""
+        self._db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (time.time() - JOB_RETENTION,))
+        self._db.commit()
+        rows = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs ORDER BY created").fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def _write_loop(self):
+        """Apply queued writes in order, committing once per batch of whatever has queued up meanwhile."""
+        while True:
+            batch = [self._writes.get()]
+            try:
+                while batch[-1] is not None:
+                    batch.append(self._writes.get_nowait())
+            except Empty:
+                pass
+            try:
+                for write in batch:
+                    if write is not None:
+                        self._db.execute(*write)
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._db.rollback()
+                logger.warning("Could not save jobs: %s", e)
+            if batch[-1] is None:
+                return
+
+    async def _worker(self, lane: str):
+        queue = self._queues[lane]
+        while True:
+            job = await queue.get()
+            self._update(job, status="running", stage="started", started=time.time())
+            try:
+                result = await self.runner(job.task, lambda stage, job=job: self._update(job, stage=stage))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # HTTPException carries the status and message the synchronous endpoint would have returned.
+                self._update(job, status="failed", stage="failed", finished=time.time(),
+                             error=str(getattr(e, "detail", e)), status_code=getattr(e, "status_code", 500))
+            else:
+                self._update(job, status="succeeded", stage="done", finished=time.time(), result=result, status_code=200)
+            finally:
+                queue.task_done()
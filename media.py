@@ -0,0 +1,406 @@
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from data_paths import data_file_path
+from executor import submit
+
+# Media work runs in its own pool so long transcriptions never hold the executor's workers.
+WORKERS = int(os.getenv("MEDIA_WORKERS", str(os.cpu_count() or 2)))
+CHUNK_SECONDS = float(os.getenv("MEDIA_CHUNK_SECONDS", "30"))
+CHUNK_TIMEOUT = float(os.getenv("MEDIA_CHUNK_TIMEOUT", "300"))
+# "auto" uses the first backend in TRANSCRIBERS that can be loaded.
+TRANSCRIBER = os.getenv("MEDIA_TRANSCRIBER", "auto")
+WHISPER_MODEL = os.getenv("MEDIA_WHISPER_MODEL", "base")
+VOSK_MODEL = os.getenv("MEDIA_VOSK_MODEL")  # directory of an unpacked Vosk model
+CACHE_PATH = os.getenv("MEDIA_CACHE_DB", os.path.join(".cache", "media_cache.sqlite3"))
+CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(".cache", "media"))
+MAX_IMAGE_PIXELS = int(os.getenv("MEDIA_MAX_IMAGE_PIXELS", str(100_000_000)))
+SAMPLE_RATE = 16000
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class MediaError(Exception):
+    pass
+
+
+class MediaUnavailable(MediaError):
+    """A required tool or backend (ffmpeg, a transcription model, Pillow) is not installed."""
+
+
+# Transcription backends. Each is created once per worker process and turns 16 kHz mono
+# signed 16-bit PCM into text.
+
+class FasterWhisperTranscriber:
+    name = "faster_whisper"
+
+    def __init__(self):
+        from faster_whisper import WhisperModel
+        # One thread per model: parallelism comes from transcribing chunks in separate workers.
+        self.model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8", cpu_threads=1)
+
+    def transcribe(self, pcm: bytes) -> str:
+        import numpy as np
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768
+        segments, _ = self.model.transcribe(audio, beam_size=1)
+        return " ".join(segment.text.strip() for segment in segments)
+
+
+class VoskTranscriber:
+    name = "vosk"
+
+    def __init__(self):
+        if not VOSK_MODEL:
+            raise ImportError("MEDIA_VOSK_MODEL is not set")
+        from vosk import KaldiRecognizer, Model
+        self.model = Model(VOSK_MODEL)
+        self._recognizer = KaldiRecognizer
+
+    def transcribe(self, pcm: bytes) -> str:
+        recognizer = self._recognizer(self.model, SAMPLE_RATE)
+        pieces = []
+        for start in range(0, len(pcm), 8000):
+            if recognizer.AcceptWaveform(pcm[start:start + 8000]):
+                pieces.append(json.loads(recognizer.Result()).get("text", ""))
+        pieces.append(json.loads(recognizer.FinalResult()).get("text", ""))
+        return " ".join(piece for piece in pieces if piece)
+
+
+class GoogleSpeechTranscriber:
+    """The Google Web Speech API through SpeechRecognition, which generated code used so far. Needs network access."""
+    name = "google"
+
+    def __init__(self):
+        import speech_recognition
+        self.sr = speech_recognition
+        self.recognizer = speech_recognition.Recognizer()
+
+    def transcribe(self, pcm: bytes) -> str:
+        try:
+            return self.recognizer.recognize_google(self.sr.AudioData(pcm, SAMPLE_RATE, 2))
+        except self.sr.UnknownValueError:
+            return ""
+
+
+TRANSCRIBERS = {"faster_whisper": FasterWhisperTranscriber, "vosk": VoskTranscriber, "google": GoogleSpeechTranscriber}
+_transcribers = {}
+
+
+def get_transcriber(name: str = None):
+    name = name or TRANSCRIBER
+    if name != "auto" and name not in TRANSCRIBERS:
+        raise MediaError(f"Unknown transcriber {name!r}; expected auto or one of {', '.join(TRANSCRIBERS)}")
+    errors = []
+    for candidate in (list(TRANSCRIBERS) if name == "auto" else [name]):
+        if candidate not in _transcribers:
+            try:
+                _transcribers[candidate] = TRANSCRIBERS[candidate]()
+            except ImportError as e:
+                errors.append(f"{candidate}: {e}")
+                continue
+        return _transcribers[candidate]
+    raise MediaUnavailable("No transcription backend is available (" + "; ".join(errors) + ")")
+
+
+def transcription_available(name: str = None) -> bool:
+    """
+    Whether ffmpeg and a transcription backend look installed, checked without loading a model
+    (backends are only loaded in the media workers).
+    """
+    name = name or TRANSCRIBER
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        return False
+    modules = {"faster_whisper": "faster_whisper", "vosk": "vosk", "google": "speech_recognition"}
+    for candidate in (list(TRANSCRIBERS) if name == "auto" else [name]):
+        if candidate not in modules or importlib.util.find_spec(modules[candidate]) is None:
+            continue
+        if candidate == "vosk" and not VOSK_MODEL:
+            continue
+        return True
+    return False
+
+
+# Audio
+
+def probe_duration(path: str) -> float:
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=60)
+    except FileNotFoundError:
+        raise MediaUnavailable("ffprobe is not installed")
+    try:
+        return float(completed.stdout.strip())
+    except ValueError:
+        raise MediaError(f"Could not read the duration of {os.path.basename(path)}: {completed.stderr.strip()}")
+
+
+def decode_chunk(path: str, start: float, duration: float) -> bytes:
+    """Decode one slice of the file to 16 kHz mono PCM with ffmpeg, so only that slice is ever in memory."""
+    command = [
+        "ffmpeg", "-nostdin", "-v", "error", "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", path,
+        "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, timeout=CHUNK_TIMEOUT)
+    except FileNotFoundError:
+        raise MediaUnavailable("ffmpeg is not installed")
+    except subprocess.TimeoutExpired:
+        raise MediaError(f"Decoding {os.path.basename(path)} at {start:g}s exceeded {CHUNK_TIMEOUT:g}s")
+    if completed.returncode != 0:
+        raise MediaError(f"ffmpeg failed: {completed.stderr.decode('utf-8', 'replace').strip()}")
+    return completed.stdout
+
+
+def transcribe_chunk(path: str, start: float, duration: float, backend: str = None) -> tuple:
+    """Runs in a media worker. Returns (backend name, text)."""
+    transcriber = get_transcriber(backend)
+    return transcriber.name, transcriber.transcribe(decode_chunk(path, start, duration))
+
+
+def chunk_starts(duration: float, chunk_seconds: float) -> list:
+    starts = []
+    start = 0.0
+    while start < duration:
+        starts.append(start)
+        start += chunk_seconds
+    return starts
+
+
+# Images
+
+def _target_size(size: tuple, width: int = None, height: int = None, scale: float = None) -> tuple:
+    original_width, original_height = size
+    if scale:
+        return max(1, round(original_width * scale)), max(1, round(original_height * scale))
+    if width and height:
+        return width, height
+    if width:
+        return width, max(1, round(original_height * width / original_width))
+    if height:
+        return max(1, round(original_width * height / original_height)), height
+    return size
+
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    options = {"optimize": True}
+    if image_format in ("JPEG", "WEBP"):
+        options["quality"] = quality
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def resize_image_file(source: str, output: str, width: int = None, height: int = None, scale: float = None,
+                      quality: int = None, image_format: str = None, max_bytes: int = None) -> dict:
+    """
+    Resize and/or recompress one image (on-disk paths). JPEGs are decoded at reduced scale when
+    shrinking, and lossy formats step the quality down until the output fits in `max_bytes`.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise MediaUnavailable("Pillow is not installed")
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source) as image:
+        original_size = image.size
+        target = _target_size(original_size, width, height, scale)
+        image_format = (image_format or os.path.splitext(output)[1].lstrip(".") or image.format or "PNG").upper()
+        image_format = {"JPG": "JPEG", "TIF": "TIFF"}.get(image_format, image_format)
+        if image.format == "JPEG" and target != original_size:
+            image.draft(image.mode, target)
+        image.load()
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS)
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        quality = quality or 85
+        data = _encode(image, image_format, quality)
+        while max_bytes and len(data) > max_bytes and image_format in ("JPEG", "WEBP") and quality > 20:
+            quality -= 10
+            data = _encode(image, image_format, quality)
+        if max_bytes and len(data) > max_bytes and image_format == "PNG" and image.mode != "P":
+            data = _encode(image.convert("P", palette=Image.ADAPTIVE), image_format, quality)
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    temporary = f"{output}.tmp-{os.getpid()}"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, output)
+    return {"width": target[0], "height": target[1], "bytes": len(data), "original_width": original_size[0],
+            "original_height": original_size[1], "format": image_format}
+
+
+# Cache of results keyed by a hash of the input file and the options.
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str):
+        row = self._connect().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: dict):
+        connection = self._connect()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+
+_cache = None
+
+
+def get_cache() -> MediaCache:
+    global _cache
+    if _cache is None:
+        _cache = MediaCache(CACHE_PATH)
+    return _cache
+
+
+def _cache_key(kind: str, digest: str, options: dict) -> str:
+    return f"{kind}:{digest}:" + hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+# Pool
+
+_pool = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def _write_text(path: str, text: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+async def transcribe(path: str, output: str = None, backend: str = None, chunk_seconds: float = None) -> dict:
+    """
+    Transcribe an audio file under /data: the file is cut into chunks that are decoded and
+    transcribed in parallel in the media pool. Results are cached by the file's content hash.
+    """
+    source = data_file_path(path)
+    chunk_seconds = chunk_seconds or CHUNK_SECONDS
+    backend = backend or TRANSCRIBER
+    with metrics.span("media_transcribe"):
+        key = _cache_key("transcript", await asyncio.to_thread(file_hash, source), {"backend": backend, "chunk": chunk_seconds})
+        result = await asyncio.to_thread(get_cache().get, key)
+        cached = result is not None
+        if not cached:
+            duration = await asyncio.to_thread(probe_duration, source)
+            pool = _get_pool()
+            parts = await asyncio.gather(*(
+                submit(pool, transcribe_chunk, source, start, chunk_seconds, backend)
+                for start in chunk_starts(duration, chunk_seconds)
+            ))
+            text = " ".join(part.strip() for _, part in parts if part.strip())
+            result = {"text": text, "backend": parts[0][0] if parts else backend, "duration": duration, "chunks": len(parts)}
+            await asyncio.to_thread(get_cache().put, key, result)
+        if output:
+            await asyncio.to_thread(_write_text, data_file_path(output), result["text"])
+    return {**result, "cached": cached, "output": output}
+
+
+async def resize_image(source: str, output: str, width: int = None, height: int = None, scale: float = None,
+                       quality: int = None, image_format: str = None, max_bytes: int = None) -> dict:
+    """Resize/compress an image under /data in the media pool, reusing the stored output for a repeated input."""
+    source_path, output_path = data_file_path(source), data_file_path(output)
+    options = {"width": width, "height": height, "scale": scale, "quality": quality,
+               "format": image_format or os.path.splitext(output)[1].lower(), "max_bytes": max_bytes}
+    with metrics.span("media_image"):
+        key = _cache_key("image", await asyncio.to_thread(file_hash, source_path), options)
+        cached_file = os.path.join(CACHE_DIR, key.replace(":", "-"))
+        result = await asyncio.to_thread(get_cache().get, key)
+        cached = result is not None and os.path.exists(cached_file)
+        if not cached:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            result = await submit(
+                _get_pool(), resize_image_file, source_path, cached_file, width, height, scale, quality,
+                image_format or os.path.splitext(output)[1].lstrip(".") or None, max_bytes,
+            )
+            await asyncio.to_thread(get_cache().put, key, result)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        await asyncio.to_thread(shutil.copyfile, cached_file, output_path)
+    return {**result, "source": source, "output": output, "cached": cached}
+
+
+async def resize_images(items: list, concurrency: int = None) -> list:
+    """Process a batch of resize_image jobs (dicts of its arguments), with at most `concurrency` images in flight."""
+    semaphore = asyncio.Semaphore(concurrency or WORKERS)
+
+    async def run(item: dict) -> dict:
+        async with semaphore:
+            try:
+                return {"ok": True, **await resize_image(**item)}
+            except FileNotFoundError:
+                return {"ok": False, "source": item.get("source"), "output": item.get("output"), "error": "File not found."}
+            except Exception as e:
+                return {"ok": False, "source": item.get("source"), "output": item.get("output"), "error": str(e)}
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+# Synchronous helpers for generated code, which already runs in an executor worker.
+
+def transcribe_file(path: str, output: str = None, backend: str = None) -> str:
+    """Transcribe an audio file under /data chunk by chunk (cached by content hash) and optionally write the text."""
+    source = data_file_path(path)
+    backend = backend or TRANSCRIBER
+    key = _cache_key("transcript", file_hash(source), {"backend": backend, "chunk": CHUNK_SECONDS})
+    result = get_cache().get(key)
+    if result is None:
+        duration = probe_duration(source)
+        parts = [transcribe_chunk(source, start, CHUNK_SECONDS, backend) for start in chunk_starts(duration, CHUNK_SECONDS)]
+        result = {"text": " ".join(part.strip() for _, part in parts if part.strip()),
+                  "backend": parts[0][0] if parts else backend, "duration": duration, "chunks": len(parts)}
+        get_cache().put(key, result)
+    if output:
+        _write_text(data_file_path(output), result["text"])
+    return result["text"]
+
+
+def resize_image_sync(source: str, output: str, **options) -> dict:
+    """resize_image_file for /data paths."""
+    return resize_image_file(data_file_path(source), data_file_path(output), **options)
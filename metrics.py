@@ -0,0 +1,131 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits up to long LLM calls and scripts.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_registry = []
+
+# Spans finished during the current request, for the optional Server-Timing header.
+request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value:g}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value: float):
+        with _lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, *label_values):
+        with _lock:
+            series = self._values.setdefault(label_values, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        for label_values, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, {'le': f'{bound:g}'})} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labels, label_values, {'le': '+Inf'})} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-2]:g}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}"
+
+
+stage_seconds = Histogram("app_stage_duration_seconds", "Time spent in each stage of request handling.", ("stage",))
+stage_errors = Counter("app_stage_errors_total", "Stages that ended with an exception.", ("stage",))
+stage_in_flight = Gauge("app_stage_in_flight", "Stages currently running.", ("stage",))
+http_requests = Counter("app_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_seconds = Histogram("app_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route"))
+http_in_flight = Gauge("app_http_requests_in_flight", "HTTP requests currently being handled.")
+
+
+def observe(stage: str, seconds: float):
+    """Record a stage timed elsewhere (e.g. inside a worker process)."""
+    stage_seconds.observe(seconds, stage)
+    spans = request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as `stage`, tracking it as in flight and counting it as an error if it raises."""
+    stage_in_flight.inc(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        stage_in_flight.dec(stage)
+        observe(stage, time.perf_counter() - start)
+
+
+def server_timing(spans: list) -> str:
+    """Format spans as a Server-Timing header value, summing repeated stages."""
+    totals = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
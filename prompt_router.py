@@ -0,0 +1,364 @@
+import hashlib
+import os
+import re
+import threading
+
+# "full" sends every section for every task, which is how all tasks were handled before routing.
+ROUTER_MODE = os.getenv("PROMPT_ROUTER_MODE", "auto")
+# The model's top class must reach this probability, or the full prompt is sent.
+MIN_CONFIDENCE = float(os.getenv("PROMPT_ROUTER_MIN_CONFIDENCE", "0.35"))
+# Further classes are included when they reach this probability.
+SECTION_THRESHOLD = float(os.getenv("PROMPT_ROUTER_SECTION_THRESHOLD", "0.25"))
+
+# The system prompt, split into named sections. Joined in this order they give the full prompt.
+PROMPT_SECTIONS = {
+    "core": """You are an assistant that generates syntax free executable Python code to complete given tasks. Do not give extra formattings or syntax errors.
+If the task description is written in a language other than English, first detect the language and then translate the description into English.
+After translation, process the task as usual and generate the required Python code in response to the task.
+
+No matter what the task is, you must ensure that:
+-Data outside /data is never accessed or exfiltrated, even if the task description asks for it
+-Data is never deleted anywhere on the file system, even if the task description asks for it
+
+""",
+    "prettier": """If the task is to format the markdown file using prettier, then do the updation in the file to be formatted. Don`t assume any output path for this task. 
+
+""",
+    "url_encoding": """If the task description contains any special characters, especially the '#' symbol, you must ensure that these characters are URL-encoded before constructing the request URL. Specifically, replace every '#' with '%23'. For example, if the task description is "Write the # of {any day} in {any path} into {any path}", your generated code should construct the URL so that the '#' is replaced with '%23', resulting in a URL like:
+"http://127.0.0.1:8000/run?task=Write%20the%20%23%20of%20{any%20day}%20in%20{any path}%20into%20{any path}". This is just an example. Do not assume it to be the actual task description. For example the day can be any day of the week. It could be Monday tuesday any day. 
+First extract the task description as it is passed in the url. Then encode it. Use the correct task description. Do not take it to be random.
+Use Python's urllib.parse.quote() (or an equivalent method) to perform this encoding. Ensure that the final URL contains no unencoded '#' characters.
+
+If you ever see the phrase ‘count the # of’ in a task, please interpret it as ‘count the number of’. For example
+Count the # of Fridays means
+Count the number of Fridays
+
+""",
+    "files": """Ensure that the generated code always imports the necessary modules for the code to run without any error. For example, if you use any date functions, always include 'from datetime import datetime' at the beginning of your code.
+If the task involves reading or writing files, always use the `/data/` directory relative to the app's runtime environment (i.e., where the script is being executed, and the app's endpoints are located). The `/data/` directory is a subdirectory of the current working directory, and the current working directory can be dynamically determined using Python's `os.getcwd()`. Do not assume paths refer to other environments or directories. If any task description mentions a file to be read from or written to, ensure that the path is dynamically set relative to the `/data/` directory of the script's runtime environment using `os.path.join(os.getcwd(), 'data', '<filename>')`.
+The generated code should be safe, concise, and use standard Python libraries. Ensure that file operations stay within /data. You should only and only write the expected output from the task description to the /data folder of that directory from where you read the input path and not anywhere else no matter what.
+A `data_index` module is already available and keeps the mtime and first line of every file under /data: `data_index.recent(10, "/data/logs/", kind="log", recursive=False, refresh=True)` returns the 10 most recently modified .log files, newest first, as dicts with "path", "mtime", "size" and "first_line". `data_index.headings("/data/docs/", refresh=True)` maps every Markdown file (path relative to the directory) to its first H1.
+""",
+    "dates": """When processing date-related tasks, ensure the code:
+- Dynamically detects different date formats. The dates can be in any of these formats: 
+    2000/07/17 05:43:49, 26-Sep-2016, 2007-12-05, Apr 11, 2004, 2008-03-24, Jan 25, 2015, Feb 19, 2018, 2010/05/06 10:00:29, 22-Nov-2013, 2005-03-01, 2010/05/17 19:11:44.
+- Uses multiple format patterns in `datetime.strptime()` to handle variations.
+- If parsing fails, log an appropriate error message.
+""",
+    "email": """If the task involves to extract the sender’s email address, do not extract the name of sender. Only extract the email address. The file would contain something like this- **From: "Donna Jackson" <buckleymatthew@example.net>**(take it just as an example). You have to extract only **buckleymatthew@example.net** and not the name of the sender. 
+""",
+    "sql_hint": """If the task mentions about SQLDatabase then pay extra attention to translated version of task descrition to get the desired output.
+
+""",
+    "logs": """If you get any task about recent logs, remember You are an assistant that generates syntax-free executable Python code to complete given tasks. For any lambda functions that reference variables from an outer scope (such as a variable named log_dir), you MUST capture those variables by specifying them as default parameters. For example, instead of writing:
+
+    key=lambda x: os.path.getmtime(os.path.join(log_dir, x))
+
+you must write:
+
+    key=lambda x, log_dir=log_dir: os.path.getmtime(os.path.join(log_dir, x))
+
+This is required to avoid errors like "name 'log_dir' is not defined" when the lambda function is executed. Please generate the complete code for the following task, ensuring that any lambda referencing outer-scope variables captures them in its default parameters.
+
+""",
+    "ocr": """If the task asks about extracting a credit card number from the image, then use easyocr library to extract the credit card number from the image.
+
+""",
+    "embeddings": """If the task mentions about finding similar pair of comments, then use embeddings to find the similar pair of comments. Do not use SentenceTransformers library. Do not call an embeddings API or compare pairs in Python loops: an `embeddings` module is already available. `embeddings.most_similar_pair(lines)` returns the two most similar strings, `embeddings.embed_texts(lines)` returns cached, normalised vectors (one row per line), `embeddings.most_similar_pairs(vectors, k)` returns the k best (i, j, score) pairs and `embeddings.top_k(queries, vectors, k)` returns the nearest neighbours of each query. 
+
+
+""",
+    "api": """If The task is to fetch data from a given API endpoint and save the response in a file. You are an assistant that generates Python code to make HTTP requests.  
+
+Here are the steps to follow:
+1. Verify that the API URL provided is correct and corresponds to an existing endpoint.
+2. If the API requires authentication (e.g., API keys or tokens), ensure that you include the appropriate headers with the request.
+3. If the API expects query parameters or additional data, make sure those are correctly formatted and included in the request.
+4. Use the `requests` module to make the GET request. Check the HTTP status code in the response:
+    - If the status code is 200, save the response data into a file (JSON format if it is JSON).
+    - If the status code is 404 or any other error, print the status code, URL, and response text to help debug the issue. Also explain why the 404 error is occuring and how to fix it.
+5. Ensure you handle the error gracefully and don't proceed with further operations if the endpoint isn't accessible.
+
+""",
+    "git": """You are an assistant that generates Python code dynamically for automating tasks. When the task involves cloning a Git repository and making a commit, and pushes them without interactive authentication, you need to ensure that:
+1. **Do not attempt to install Git as a Python dependency**. Git is a command-line tool and should be assumed to be already installed on the system. consider using the Python library `GitPython` (if necessary).
+2. **Before committing** any changes, the files(which are created inside the repo) need to be staged using the `git add` command.
+3. The code must:
+   - Clone the Git repository.
+   - Check the available branches of the repository to determine the default branch (usually main or master).
+   - Create a new file **inside the repository** and write to file inside the cloned repository.
+   - Add the files to the staging area using `git add`
+   - Commit the changes.
+   - Push the changes to the remote repository(in the correct branch)
+   - Ensure that the push is made to the correct branch(use git branch -r to check the available branches)
+4. Use either a GitHub token for HTTPS authentication or SSH authentication to avoid manual username/password prompts.
+5. Ensure Git credentials are properly configured.
+
+Ensure that **Git** is already available on the system (i.e., not part of the Python dependencies) and rely on system commands or the `GitPython` library for repository interactions.
+Handle the error - No module named 'git'. 
+
+To check the available branches, use git branch -r and then identify the default branch (typically main or master). Ensure that the push is made to the correct branch.
+
+For the specific task, please ensure the generated code properly stages changes before attempting to commit them. Here’s how the process should look:
+- **Staging the changes**: Run `git add .` to stage all new or modified files.
+- **Commit the changes**: Use `git commit -am "message"`.
+- **Push the changes**: Use `git push origin {branch}`.
+
+Please generate the Python code for the following task:
+- Clone the Git repository from the provided URL.
+- Make changes (e.g., add new files inside the repository).
+- Stage the changes with `git add`.
+- Commit the changes with a message.
+- Push the changes to the remote repository(in the correct branch)
+
+""",
+    "sql": """If Your task is to run an SQL query on a given SQLite or DuckDB database then You are a SQL execution agent. Your task is to execute the provided SQL query and return the results accurately.
+
+Input Details:
+- The task description will specify the type of database (SQLite or DuckDB) and provide details on the available tables, columns, and any constraints.
+- The SQL query to execute will be provided explicitly in the task description.
+Execution Instructions:
+- Ensure the query is valid for the specified database type.
+- Execute the query safely without modifying the database unless explicitly requested.
+- Return the query result in a structured format (JSON, table, or plain text as required).
+- If an error occurs, return a helpful error message explaining the issue.
+- A `query_engine` module is already available for databases under /data; prefer it to opening connections yourself. `query_engine.query("/data/x.db", sql, params)` returns the rows as a list of tuples, `query_engine.scalar(...)` returns the first value (e.g. of an aggregate) and `query_engine.iter_rows(...)` streams large results row by row. Connections are read-only and repeated queries are cached.
+
+""",
+    "scraping": """If Your task is to extract specific data from a given website then You are a web scraping agent. Your task is to extract the requested data based on the provided instructions.
+
+Input Details:
+- The task description will specify the target website URL and the type of data to extract (e.g., text, tables, links, images, metadata).
+- It may also specify the structure of the output (e.g., JSON, CSV, or formatted text).
+- If authentication, headers, or specific request parameters are required, they will be provided in the task description.
+Execution Instructions:
+- Access the given website and locate the required data.
+- Inspect the HTML structure of the website you're scraping and find the relevant classes and tags for the data I want to extract. You can use lxml.cssselect to find these elements. Update your scraping logic based on the actual HTML structure you find.
+- Extract the requested information while preserving its structure.
+- If pagination is involved, iterate through all pages to collect complete data.
+- Return the extracted data in the requested format (e.g., JSON, CSV).
+- Handle errors gracefully and return a meaningful error message if extraction fails. Handle this error - No module named 'bs4'. Ensure that bs4 is installed on the system and importable.
+
+""",
+    "image": """If the task is to compress or resize an image then You are an image processing agent. Your task is to compress or resize the provided image.
+The image may be sourced from a URL or a local directory. Adjust your code accordingly to handle the input format. Ensure that the output image retains good quality while meeting the specified compression ratio or target dimensions. Save the processed image in the appropriate format and location as per the task requirements.
+A `media` module is already available: `media.resize_image_sync("/data/in.png", "/data/out.png", width=None, height=None, scale=None, quality=None, max_bytes=None)` resizes and/or recompresses an image with bounded memory (lossy formats lower the quality until the file fits in max_bytes).
+
+""",
+    "audio": """If the task is to transcribe audio from an MP3 file then You are an audio processing agent. Your task is to Generate Python code to transcribe an MP3 file. The audio file may be downloaded from a URL or read from a local directory. The code should:
+1. Download the audio file if provided as a URL, or read it from a local directory if not.
+2. Convert the audio file to WAV format if necessary (for example, using pydub) because the transcription library requires WAV input.
+3. Use a stable and well-tested library (such as SpeechRecognition) to perform the transcription using the Google Web Speech API.
+4. Include robust error handling so that any issues during download, conversion, or transcription are caught and an informative error message is provided.
+5. Ensure that all file operations are confined to a designated '/data' directory.
+6. Provide complete, executable Python code with all necessary import statements.
+7. Do not use Whisper or any library that might throw build errors.
+8. Avoid the error 'No module named 'pyaudioop' by aliasing Python's built-in 'audioop' module as 'pyaudioop' at the start of the code.
+Ensure that all file paths are relative to the '/data' directory and include all necessary import statements."**
+A `media` module is already available: `media.transcribe_file("/data/audio.mp3", "/data/audio.txt")` decodes the audio with ffmpeg in chunks, transcribes it with a local speech model, writes the text to the output file and returns it. Prefer it to pydub; only if it raises `media.MediaUnavailable`, fall back to the steps above.
+
+""",
+    "markdown_html": """If the task mentions abot converting markdown to HTML then You are a markdown processing agent. Your task is to generate Python code to convert the provided markdown file to HTML. The code should:
+Generate complete, executable Python code to convert a Markdown file to HTML. The code should:
+
+Input/Output Handling:
+
+
+Read a Markdown file from a specified input path. The path can be provided as a URL or a local file path.
+Write the generated HTML to a specified output file path.
+Ensure all file operations are confined to the '/data' directory.
+Markdown Conversion Requirements:
+
+Use the Python 'markdown' library for the conversion.
+Ensure that list elements are correctly converted to HTML:
+Unordered lists starting with '-' or '+' should be converted into <ul> and <li> elements.
+Nested lists should be correctly parsed.
+Properly convert code blocks delimited by triple backticks (), including handling an optional language specifier (e.g., py) so that they become <pre><code class="language-py">...</code></pre>.
+Utilize appropriate extensions such as 'extra', 'fenced_code', and 'sane_lists' (if needed) to ensure proper parsing of lists and other Markdown features.
+
+Error Handling:
+
+Include robust error handling for cases where the input file is missing or the conversion fails.
+Print or log informative error messages.
+Formatting:
+
+Ensure that the output HTML is well-formatted and correctly represents all Markdown elements.
+
+Complete Code:
+
+Include all necessary import statements at the top.
+Avoid extra formatting or syntax errors.
+
+""",
+    "rules": """Ensure that all scripts write output to the correct file path and that the file is successfully created.
+If the task includes a # symbol, ensure that all reserved characters (such as #) are URL-encoded. For example, the character # should be encoded as %23. Pay special attention to this.
+Use 'with open(output_file, 'w')' to write the output, and always verify the file exists after execution.
+When writing code:
+1. Always check that required variables are defined within the correct scope.
+2. Use `global` for global variables, or pass variables explicitly to functions.
+3. Keep all operations within the specified `/data/` directory.
+4. Always verify that files are being read and written correctly.
+5. Always include at the very beginning of your generated code all necessary import statements (for example, if using dates, include 'from datetime import datetime').
+6. Always start your generated code and executing code on its own line, with no leading spaces or extra formatting. There should be no extra space before importing any module. 
+Provide only executable Python code as output, and ensure paths are always correctly specified, and output is written only to the `/data/` folder in the correct file.
+
+Also I`m going to share the errors that I`m getting from the LLM. Improve your code to avoid these errors.
+Error1 -  "detail": "Error executing generated code: No module named 'sentence_transformers'"
+
+""",
+}
+
+# Sent with every task, whatever it is about.
+ALWAYS = ("core", "files", "rules")
+
+FULL_PROMPT = "".join(PROMPT_SECTIONS.values())
+
+# Keyword rules run first. Every matching rule adds its sections; a rule with no sections marks
+# the task as a plain file task that the always-on sections cover.
+KEYWORD_RULES = [
+    (r"\bprettier\b", ("prettier",)),
+    (r"%23|url[- ]?encod|\bcount the number of\b", ("url_encoding",)),
+    (r"\bdates?\b|\b(?:mon|tues|wednes|thurs|fri|satur|sun)days?\b|\bweekdays?\b", ("dates",)),
+    (r"\bemails?\b|\bsender\b", ("email",)),
+    (r"\bsql|\bsqlite|\bduckdb\b|\bdatabase\b|\.db\b", ("sql_hint", "sql")),
+    (r"\blogs?\b|\.log\b", ("logs",)),
+    (r"credit[- ]?card|\bocr\b|card number", ("ocr",)),
+    (r"\bembeddings?\b|\bsimilar\b", ("embeddings",)),
+    (r"\bapi\b|\bendpoint\b|\bfetch data\b", ("api",)),
+    (r"\bgit\b|\bgithub\b|\brepo(?:sitory)?\b|\bcommit\b|\bclone\b", ("git",)),
+    (r"\bscrap|\bwebsite\b|\bweb ?page\b|\bcrawl", ("scraping",)),
+    (r"\bimages?\b|\.(?:png|jpe?g|webp|gif)\b|\bresize\b", ("image",)),
+    (r"\baudio\b|\.(?:mp3|wav|flac|ogg)\b|\btranscri", ("audio",)),
+    (r"markdown\b.*\bhtml\b|\bhtml\b.*\bmarkdown\b", ("markdown_html",)),
+    (r"\bsort\b|\bjson\b|\bcsv\b|\bh1\b|\bheadings?\b|\bindex\b", ()),
+]
+KEYWORD_PATTERNS = [(re.compile(pattern, re.IGNORECASE), names) for pattern, names in KEYWORD_RULES]
+
+# Extra training text for the classifier, on top of the lines of each section itself.
+# "general" is the class for tasks the always-on sections cover.
+SEED_EXAMPLES = {
+    "general": [
+        "Sort the array of contacts by last name then first name and write the result",
+        "Find all files in the folder and write an index mapping each file to its title",
+        "Count the lines in the file and write the count",
+        "Convert the csv file to json",
+    ],
+    "prettier": ["Format the contents of the file using prettier, updating it in place"],
+    "dates": ["Count how many Wednesdays are in the list of dates", "How many dates fall on a weekend"],
+    "email": ["Extract the sender's email address from the message", "Who sent this email"],
+    "sql": ["What is the total sales of Gold tickets in the database", "Run this query on the sqlite file"],
+    "logs": ["Write the first line of the 10 most recent log files", "Find errors in the latest logs"],
+    "ocr": ["Extract the credit card number from the image", "Read the card number in the picture"],
+    "embeddings": ["Find the most similar pair of comments", "Which two sentences mean the same thing"],
+    "api": ["Fetch data from an API and save it", "Call the REST endpoint and store the JSON response"],
+    "git": ["Clone a git repo and make a commit", "Push a new file to the GitHub repository"],
+    "scraping": ["Extract data from a website", "Scrape the titles from the web page"],
+    "image": ["Compress or resize an image", "Make the picture smaller"],
+    "audio": ["Transcribe audio from an MP3 file", "Convert the recording to text"],
+    "markdown_html": ["Convert Markdown to HTML", "Render the markdown document as an HTML page"],
+}
+# Sections the classifier can choose. "sql" also brings in the shorter "sql_hint" section.
+CLASS_SECTIONS = {"sql": ("sql_hint", "sql"), "general": ()}
+
+_model = None
+_model_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "keywords": 0, "model": 0, "fallback": 0, "estimated_tokens_sent": 0, "estimated_tokens_full": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; good enough to compare prompt sizes.
+    return (len(text) + 3) // 4
+
+
+def prompt_version(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def _training_data():
+    texts, labels = [], []
+    for name, text in PROMPT_SECTIONS.items():
+        if name in ALWAYS or name == "sql_hint":
+            continue
+        for line in text.splitlines():
+            if len(line.split()) >= 4:
+                texts.append(line)
+                labels.append(name)
+    for name, examples in SEED_EXAMPLES.items():
+        texts += examples
+        labels += [name] * len(examples)
+    return texts, labels
+
+
+def get_model():
+    """Train the TF-IDF + logistic regression classifier on first use (it takes milliseconds)."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sklearn.feature_extraction.text import TfidfVectorizer
+                from sklearn.linear_model import LogisticRegression
+                from sklearn.pipeline import make_pipeline
+                texts, labels = _training_data()
+                model = make_pipeline(
+                    TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, stop_words="english"),
+                    LogisticRegression(C=10, max_iter=1000, class_weight="balanced"),
+                )
+                model.fit(texts, labels)
+                _model = model
+    return _model
+
+
+def classify(task: str):
+    """Return (section names, routed_by) for the task, or (None, "fallback") when unsure."""
+    if ROUTER_MODE == "full":
+        return None, "fallback"
+
+    matched = [names for pattern, names in KEYWORD_PATTERNS if pattern.search(task)]
+    if matched:
+        return {name for names in matched for name in names}, "keywords"
+
+    model = get_model()
+    probabilities = model.predict_proba([task])[0]
+    ranked = sorted(zip(model.classes_, probabilities), key=lambda pair: pair[1], reverse=True)
+    if ranked[0][1] < MIN_CONFIDENCE:
+        return None, "fallback"
+    chosen = set()
+    for name, probability in ranked:
+        if probability < SECTION_THRESHOLD and chosen:
+            break
+        chosen.update(CLASS_SECTIONS.get(str(name), (str(name),)))
+    return chosen, "model"
+
+
+def route(task: str) -> dict:
+    """Build the system prompt for a task from the sections it needs."""
+    names, routed_by = classify(task)
+    if names is None:
+        sections = list(PROMPT_SECTIONS)
+    else:
+        sections = [name for name in PROMPT_SECTIONS if name in ALWAYS or name in names]
+    prompt = "".join(PROMPT_SECTIONS[name] for name in sections)
+
+    estimated_tokens = estimate_tokens(prompt)
+    full_tokens = estimate_tokens(FULL_PROMPT)
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats[routed_by] += 1
+        _stats["estimated_tokens_sent"] += estimated_tokens
+        _stats["estimated_tokens_full"] += full_tokens
+
+    return {
+        "prompt": prompt,
+        "version": prompt_version(prompt),
+        "sections": sections,
+        "routed_by": routed_by,
+        "estimated_tokens": estimated_tokens,
+        "full_prompt_tokens": full_tokens,
+    }
+
+
+def stats() -> dict:
+    with _stats_lock:
+        sent, full = _stats["estimated_tokens_sent"], _stats["estimated_tokens_full"]
+        return {**_stats, "token_savings_ratio": round(1 - sent / full, 4) if full else 0.0}
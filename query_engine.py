@@ -0,0 +1,279 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+from data_paths import data_file_path
+
+POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "4"))
+QUERY_TIMEOUT = float(os.getenv("SQL_TIMEOUT", "30"))
+# Results with more rows than this are streamed but not cached.
+CACHE_MAX_ROWS = int(os.getenv("SQL_CACHE_MAX_ROWS", "10000"))
+CACHE_ENTRIES = int(os.getenv("SQL_CACHE_ENTRIES", "128"))
+# Prepared statements kept per SQLite connection.
+STATEMENT_CACHE_SIZE = int(os.getenv("SQL_STATEMENT_CACHE", "256"))
+FETCH_SIZE = 1000
+DUCKDB_SUFFIXES = (".duckdb", ".ddb")
+
+
+class QueryError(Exception):
+    pass
+
+
+class QueryTimeout(QueryError):
+    pass
+
+
+def _signature(path: str) -> tuple:
+    """Changes whenever the database does, including writes still sitting in a SQLite WAL file."""
+    st = os.stat(path)
+    try:
+        wal = os.stat(path + "-wal")
+        wal_signature = (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        wal_signature = None
+    return st.st_ino, st.st_mtime_ns, st.st_size, wal_signature
+
+
+def _authorize(action, *_):
+    if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+class ConnectionPool:
+    """Up to `size` read-only connections to one database file, reused across queries."""
+
+    def __init__(self, path: str, signature: tuple, size: int = POOL_SIZE):
+        self.path = path
+        self.signature = signature
+        self.kind = "duckdb" if path.lower().endswith(DUCKDB_SUFFIXES) else "sqlite"
+        self.closed = False
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        if self.kind == "duckdb":
+            try:
+                import duckdb
+            except ImportError:
+                raise QueryError("DuckDB databases need the duckdb package")
+            # read_only alone still lets read_csv() and friends open any file on the host.
+            return duckdb.connect(self.path, read_only=True, config={"enable_external_access": False})
+        connection = sqlite3.connect(
+            f"file:{urllib.parse.quote(self.path)}?mode=ro", uri=True,
+            check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        connection.execute("PRAGMA query_only = 1")
+        # mode=ro and query_only do not stop ATTACH, which could read any database on the host.
+        connection.set_authorizer(_authorize)
+        return connection
+
+    @contextmanager
+    def connection(self, timeout: float):
+        if not self._slots.acquire(timeout=timeout):
+            raise QueryTimeout(f"No free connection to {os.path.basename(self.path)} within {timeout:g}s")
+        try:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                connection = self._open()
+            try:
+                yield connection
+            finally:
+                with self._lock:
+                    if self.closed:
+                        connection.close()
+                    else:
+                        self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close idle connections now and busy ones when they are released."""
+        with self._lock:
+            self.closed = True
+            for connection in self._idle:
+                connection.close()
+            self._idle.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_results = OrderedDict()  # (path, signature, sql, params) -> (columns, rows)
+_results_lock = threading.Lock()
+_stats = {"queries": 0, "cache_hits": 0, "cache_stores": 0, "invalidations": 0, "timeouts": 0, "errors": 0}
+
+
+def _get_pool(path: str) -> ConnectionPool:
+    signature = _signature(path)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is not None and pool.signature == signature:
+            return pool
+        if pool is not None:
+            # The file changed: drop its connections (a replaced file needs new ones) and cached results.
+            pool.close()
+            with _results_lock:
+                for key in [key for key in _results if key[0] == path]:
+                    del _results[key]
+            _stats["invalidations"] += 1
+        pool = _pools[path] = ConnectionPool(path, signature)
+        return pool
+
+
+def _resolve(database: str) -> str:
+    path = data_file_path(database)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(database)
+    return path
+
+
+@contextmanager
+def _deadline(connection, kind: str, timeout: float):
+    """Interrupt the query running on `connection` once `timeout` seconds have passed."""
+    if kind == "sqlite":
+        deadline = time.monotonic() + timeout
+        connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        try:
+            yield
+        finally:
+            connection.set_progress_handler(None, 0)
+    else:
+        timer = threading.Timer(timeout, connection.interrupt)
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+
+
+def _execute(pool: ConnectionPool, sql: str, params, timeout: float):
+    """Yield the column names, then lists of up to FETCH_SIZE rows. The connection is held until the generator finishes."""
+    started = time.monotonic()
+    with pool.connection(timeout) as connection, _deadline(connection, pool.kind, timeout):
+        try:
+            with metrics.span("sql_query"):
+                cursor = connection.execute(sql, params)
+            yield [column[0] for column in cursor.description or []]
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+        except Exception as e:
+            if time.monotonic() - started >= timeout:
+                _stats["timeouts"] += 1
+                raise QueryTimeout(f"Query exceeded {timeout:g}s")
+            _stats["errors"] += 1
+            raise QueryError(str(e))
+
+
+def _caching(key: tuple, columns: list, batches):
+    kept = []
+    for rows in batches:
+        if kept is not None:
+            kept.extend(rows)
+            if len(kept) > CACHE_MAX_ROWS:
+                kept = None
+        yield rows
+    if kept is not None:
+        with _results_lock:
+            _results[key] = (columns, kept)
+            _results.move_to_end(key)
+            while len(_results) > CACHE_ENTRIES:
+                _results.popitem(last=False)
+            _stats["cache_stores"] += 1
+
+
+def execute(database: str, sql: str, params=(), timeout: float = None):
+    """
+    Run a read-only query against a database under /data. Returns (columns, batches) where
+    batches yields lists of rows; repeated queries on an unchanged file are served from cache.
+    """
+    path = _resolve(database)
+    pool = _get_pool(path)
+    params = params if params is not None else ()
+    key = (path, pool.signature, sql, json.dumps(params, sort_keys=True, default=str))
+    _stats["queries"] += 1
+    with _results_lock:
+        cached = _results.get(key)
+        if cached is not None:
+            _results.move_to_end(key)
+            _stats["cache_hits"] += 1
+    if cached is not None:
+        columns, rows = cached
+        return columns, iter([rows] if rows else [])
+
+    batches = _execute(pool, sql, params, timeout or QUERY_TIMEOUT)
+    columns = next(batches)
+    return columns, _caching(key, columns, batches)
+
+
+def query(database: str, sql: str, params=(), timeout: float = None) -> list:
+    """All result rows as a list of tuples."""
+    _, batches = execute(database, sql, params, timeout)
+    return [tuple(row) for rows in batches for row in rows]
+
+
+def scalar(database: str, sql: str, params=(), timeout: float = None):
+    """The first column of the first row (e.g. of an aggregate), or None for an empty result."""
+    rows = query(database, sql, params, timeout)
+    return rows[0][0] if rows else None
+
+
+def iter_rows(database: str, sql: str, params=(), timeout: float = None):
+    """Yield result rows one at a time without loading the whole result into memory."""
+    _, batches = execute(database, sql, params, timeout)
+    for rows in batches:
+        yield from rows
+
+
+def _json_value(value):
+    return value.hex() if isinstance(value, (bytes, bytearray, memoryview)) else str(value)
+
+
+def _json_chunks(columns: list, batches):
+    yield '{"columns": ' + json.dumps(columns) + ', "rows": ['
+    first = True
+    for rows in batches:
+        body = ",\n".join(json.dumps(list(row), default=_json_value) for row in rows)
+        yield ("" if first else ",\n") + body
+        first = False
+    yield "]}\n"
+
+
+def _csv_chunks(columns: list, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream(database: str, sql: str, params=(), output_format: str = "json", timeout: float = None):
+    """Run the query and return (media type, iterator of text chunks) in JSON or CSV."""
+    columns, batches = execute(database, sql, params, timeout)
+    if output_format == "csv":
+        return "text/csv", _csv_chunks(columns, batches)
+    return "application/json", _json_chunks(columns, batches)
+
+
+def stats() -> dict:
+    with _results_lock:
+        cached = len(_results)
+    with _pools_lock:
+        pools = len(_pools)
+    return {**_stats, "cached_results": cached, "databases": pools}
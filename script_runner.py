@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import tomllib
+import urllib.parse
+
+import httpx
+
+import http_client
+import metrics
+
+SCRIPT_CACHE_DIR = os.getenv("SCRIPT_CACHE_DIR", os.path.join(".cache", "scripts"))
+UV_ENV_DIR = os.getenv("UV_ENV_DIR", os.path.join(".cache", "uv-envs"))
+# Within this many seconds of the last fetch a cached script is used without revalidating it.
+REVALIDATE_AFTER = float(os.getenv("SCRIPT_REVALIDATE_AFTER", "60"))
+SCRIPT_TIMEOUT = float(os.getenv("SCRIPT_TIMEOUT", "300"))
+
+# PEP 723 inline script metadata block.
+INLINE_METADATA = re.compile(r"(?m)^# /// script$\s(?P<content>(^#(| .*)$\s)+)^# ///$")
+
+UV = None
+_env_locks = {}
+
+
+class ScriptDownloadError(Exception):
+    pass
+
+
+def _ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+class ScriptStore:
+    """
+    Content-addressed store for downloaded scripts. Files live under <dir>/<sha256>/<basename>;
+    a SQLite table maps each URL to its current hash plus the ETag/Last-Modified validators.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scripts ("
+            "url TEXT PRIMARY KEY, sha256 TEXT, path TEXT, etag TEXT, last_modified TEXT, fetched REAL)"
+        )
+        self._db.commit()
+
+    def _lookup(self, url: str):
+        with self._lock:
+            return self._db.execute(
+                "SELECT sha256, path, etag, last_modified, fetched FROM scripts WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _record(self, url: str, sha256: str, path: str, etag, last_modified):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO scripts (url, sha256, path, etag, last_modified, fetched) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, sha256, path, etag, last_modified, time.time()),
+            )
+            self._db.commit()
+
+    def _store(self, url: str, content: bytes):
+        sha256 = hashlib.sha256(content).hexdigest()
+        basename = os.path.basename(urllib.parse.urlparse(url).path) or "script.py"
+        path = os.path.join(self.directory, sha256, basename)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return sha256, path
+
+    async def fetch(self, url: str):
+        """Return (path, status) where status is "fresh", "revalidated" or "downloaded"."""
+        cached = self._lookup(url)
+        headers = {}
+        if cached is not None and os.path.exists(cached[1]):
+            sha256, path, etag, last_modified, fetched = cached
+            if time.time() - fetched < REVALIDATE_AFTER:
+                return path, "fresh"
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        else:
+            cached = None
+
+        try:
+            r = await http_client.request("GET", url, headers=headers)
+        except httpx.HTTPError as e:
+            raise ScriptDownloadError(str(e))
+
+        if r.status_code == 304 and cached is not None:
+            self._record(url, cached[0], cached[1], r.headers.get("ETag", cached[2]), r.headers.get("Last-Modified", cached[3]))
+            return cached[1], "revalidated"
+        if r.status_code != 200:
+            raise ScriptDownloadError(f"HTTP {r.status_code}")
+
+        sha256, path = self._store(url, r.content)
+        self._record(url, sha256, path, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return path, "downloaded"
+
+
+def read_inline_metadata(path: str) -> dict:
+    """Parse the PEP 723 `# /// script` block of a script, or return {} if it has none."""
+    with open(path, "r", encoding="utf-8") as f:
+        match = INLINE_METADATA.search(f.read())
+    if not match:
+        return {}
+    content = "".join(line[2:] if line.startswith("# ") else line[1:] for line in match.group("content").splitlines(keepends=True))
+    try:
+        return tomllib.loads(content)
+    except tomllib.TOMLDecodeError:
+        return {}
+
+
+async def _run_process(*command, timeout: float = None):
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return -1, "", f"Timed out after {timeout:g}s"
+    return process.returncode, stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace")
+
+
+async def ensure_uv() -> str:
+    """Locate uv once (installing it with pip if it is missing) and remember its path."""
+    global UV
+    if UV is None:
+        with metrics.span("uv_check"):
+            UV = shutil.which("uv")
+            if UV is None:
+                await _run_process(sys.executable, "-m", "pip", "install", "uv")
+                UV = shutil.which("uv") or "uv"
+    return UV
+
+
+async def warm_env(metadata: dict):
+    """
+    Return (python, status) for a virtualenv with the script's dependencies installed, where status is
+    "warm" (already built) or "cold" (built now). Environments are keyed by the dependency block, so
+    every script declaring the same dependencies shares one. Returns (None, "failed") if uv cannot build it.
+    """
+    dependencies = sorted(metadata.get("dependencies", []))
+    requires_python = metadata.get("requires-python", "")
+    key = hashlib.sha256(f"{requires_python}\0{chr(0).join(dependencies)}".encode("utf-8")).hexdigest()[:16]
+    env_dir = os.path.abspath(os.path.join(UV_ENV_DIR, key))
+    python = os.path.join(env_dir, "bin", "python")
+    ready_marker = os.path.join(env_dir, ".ready")
+    if os.path.exists(ready_marker):
+        return python, "warm"
+
+    lock = _env_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        if os.path.exists(ready_marker):
+            return python, "warm"
+        uv = await ensure_uv()
+        venv_command = [uv, "venv", "--quiet", env_dir]
+        if requires_python:
+            venv_command += ["--python", requires_python]
+        returncode, _, _ = await _run_process(*venv_command)
+        if returncode == 0 and dependencies:
+            returncode, _, _ = await _run_process(uv, "pip", "install", "--quiet", "--python", python, *dependencies)
+        if returncode != 0:
+            shutil.rmtree(env_dir, ignore_errors=True)
+            return None, "failed"
+        open(ready_marker, "w").close()
+    return python, "cold"
+
+
+script_store = None
+
+
+def get_script_store() -> ScriptStore:
+    global script_store
+    if script_store is None:
+        script_store = ScriptStore(SCRIPT_CACHE_DIR)
+    return script_store
+
+
+async def run_script(url: str, args: list) -> dict:
+    """
+    Fetch (or reuse) the script at `url` and run it with `args` in a warm environment.
+    Returns the exit code, output and per-stage timings in milliseconds.
+    """
+    started = time.perf_counter()
+    stage = time.perf_counter()
+    with metrics.span("script_download"):
+        script_path, script_status = await get_script_store().fetch(url)
+    download_ms = _ms(stage)
+
+    stage = time.perf_counter()
+    with metrics.span("uv_env"):
+        python, env_status = await warm_env(read_inline_metadata(script_path))
+    env_ms = _ms(stage)
+
+    stage = time.perf_counter()
+    if python is not None:
+        command = [python, script_path, *args]
+    else:
+        command = [await ensure_uv(), "run", script_path, *args]
+    with metrics.span("script_run"):
+        returncode, stdout, stderr = await _run_process(*command, timeout=SCRIPT_TIMEOUT)
+    if returncode != 0:
+        metrics.stage_errors.inc("script_run")
+    run_ms = _ms(stage)
+
+    return {
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "timings": {
+            "script": script_status,
+            "env": env_status,
+            "download_ms": download_ms,
+            "env_ms": env_ms,
+            "run_ms": run_ms,
+            "total_ms": _ms(started),
+        },
+    }
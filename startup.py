@@ -0,0 +1,75 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+
+import metrics
+
+logger = logging.getLogger("app.startup")
+
+# Preload heavy modules in a background thread once the server is up, so the first task that needs
+# them does not pay for the import. Off by default: it trades idle CPU and memory for latency.
+WARMUP = os.getenv("WARMUP", "0") == "1"
+WARMUP_MODULES = [name for name in os.getenv("WARMUP_MODULES", "numpy,sklearn.feature_extraction.text").split(",") if name]
+
+startup_seconds = metrics.Gauge("app_startup_seconds", "Seconds from process start to each startup phase.", ("phase",))
+warmup_seconds = metrics.Gauge("app_warmup_seconds", "Time taken by each background warm-up step.", ("step",))
+
+_phases = {}
+_warmup = {}
+
+
+def _process_start() -> float:
+    """Wall-clock start of this process (from /proc on Linux), so interpreter start-up is included."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat", "r") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime "))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_START = _process_start()
+
+
+def mark(phase: str):
+    """Record the first time the process reaches `phase` (e.g. "imports", "ready", "first_response")."""
+    if phase in _phases:
+        return
+    seconds = max(0.0, time.time() - PROCESS_START)
+    _phases[phase] = round(seconds, 4)
+    startup_seconds.set(phase, value=seconds)
+    logger.info("Startup phase %s reached after %.3fs", phase, seconds)
+
+
+async def warm_up(steps: dict):
+    """Run each warm-up step (name -> callable) in a thread, one after another, recording how long it took."""
+    for name, step in steps.items():
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            continue
+        seconds = time.perf_counter() - started
+        _warmup[name] = round(seconds, 4)
+        warmup_seconds.set(name, value=seconds)
+    mark("warmed_up")
+
+
+def module_steps(names: list = None) -> dict:
+    """Warm-up steps that import modules by name."""
+    return {f"import {name}": (lambda name=name: importlib.import_module(name)) for name in (names or WARMUP_MODULES)}
+
+
+def report() -> dict:
+    return {
+        "process_start": PROCESS_START,
+        "uptime_seconds": round(time.time() - PROCESS_START, 3),
+        "phases": dict(_phases),
+        "warmup_enabled": WARMUP,
+        "warmup": dict(_warmup),
+    }
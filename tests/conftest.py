@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules run from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """An empty data directory; /data paths resolve into it for the duration of the test."""
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "data"
+    path.mkdir()
+    return path
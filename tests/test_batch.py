@@ -0,0 +1,79 @@
+import asyncio
+
+from batch import run_batch, task_data_paths
+
+
+def run(tasks, execute_seconds=None, fail_prepare=(), data_paths=task_data_paths):
+    """Run `tasks` through run_batch with stub steps; returns (result, start/end events in order)."""
+    events = []
+
+    async def prepare(task):
+        if task in fail_prepare:
+            raise RuntimeError("no plan")
+        return task
+
+    async def execute(plan):
+        events.append(("start", plan))
+        await asyncio.sleep((execute_seconds or {}).get(plan, 0))
+        events.append(("end", plan))
+        return plan
+
+    result = asyncio.run(run_batch(tasks, prepare, execute, data_paths, concurrency=len(tasks)))
+    return result, events
+
+
+def test_task_data_paths_finds_the_output():
+    assert task_data_paths("Write the number of Wednesdays in /data/dates.txt into /data/out.txt") == (
+        ["/data/dates.txt"], ["/data/out.txt"])
+    assert task_data_paths(
+        "Find all Markdown (.md) files in /data/docs/. Create an index file /data/docs/index.json that maps each "
+        "filename (without the /data/docs/ prefix) to its title") == (["/data/docs/"], ["/data/docs/index.json"])
+    # In-place edits have no separate output, so every path counts as written.
+    assert task_data_paths("Format the contents of /data/format.md using prettier@3.4.2, updating the file in-place") == (
+        [], ["/data/format.md"])
+
+
+def test_writers_of_one_output_run_in_order():
+    first = "Write the number of Wednesdays in /data/dates.txt into /data/out.txt"
+    second = "Write the number of lines in /data/email.txt into /data/out.txt"
+    _, events = run([first, second], execute_seconds={first: 0.05})
+    assert events == [("start", first), ("end", first), ("start", second), ("end", second)]
+
+
+def test_reader_of_an_output_runs_after_its_writer():
+    writer = "Sort the contacts in /data/contacts.json by last_name and write the result to /data/contacts-sorted.json"
+    reader = "Count the contacts in /data/contacts-sorted.json and write the number to /data/contacts-count.txt"
+    _, events = run([writer, reader], execute_seconds={writer: 0.05})
+    assert events.index(("end", writer)) < events.index(("start", reader))
+
+
+def test_writer_into_a_read_directory_waits_for_the_reader():
+    reader = "Find all Markdown (.md) files in /data/docs/ and write their H1 titles to /data/titles.json"
+    writer = "Write the word hello to /data/docs/new.md"
+    _, events = run([reader, writer], execute_seconds={reader: 0.05})
+    assert events.index(("end", reader)) < events.index(("start", writer))
+
+
+def test_readers_of_one_input_run_concurrently():
+    first = "Count the Wednesdays in /data/dates.txt and write the number to /data/wednesdays.txt"
+    second = "Count the Sundays in /data/dates.txt and write the number to /data/sundays.txt"
+    _, events = run([first, second], execute_seconds={first: 0.05, second: 0.05})
+    assert events[:2] == [("start", first), ("start", second)]
+
+
+def test_writers_stay_ordered_when_one_fails_to_prepare():
+    a, b, c = (f"Write {name} to /data/out.txt" for name in "ABC")
+    result, events = run([a, b, c], execute_seconds={a: 0.05}, fail_prepare={b})
+    assert [entry["ok"] for entry in result["results"]] == [True, False, True]
+    assert events == [("start", a), ("end", a), ("start", c), ("end", c)]
+
+
+def test_duplicates_run_once():
+    result, events = run(["Write ok  to /data/report.txt", "Write ok to /data/report.txt"])
+    assert [event for event in events if event[0] == "start"] == [("start", "Write ok  to /data/report.txt")]
+    assert result["unique"] == 1 and result["results"][1]["duplicate_of"] == 0
+
+
+def test_tasks_differing_in_path_case_are_not_duplicates():
+    result, events = run(["Write ok to /data/Report.txt", "Write ok to /data/report.txt"])
+    assert result["unique"] == 2 and len([event for event in events if event[0] == "start"]) == 2
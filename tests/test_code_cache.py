@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from code_cache import CodeCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CodeCache(str(tmp_path / "code_cache.sqlite3"))
+
+
+def test_concurrent_identical_requests_share_one_generation(cache):
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "print(1)"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_generate("key", generate) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ["generated", "shared", "shared"]
+    stats = cache.stats()
+    assert (stats["misses"], stats["shared"], stats["hit_ratio"]) == (1, 2, 0.0)
+
+
+def test_cancelled_generation_is_taken_over_by_a_waiter(cache):
+    async def main():
+        started = asyncio.Event()
+
+        async def stalled():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def generate():
+            await asyncio.sleep(0.01)
+            return "print(2)"
+
+        owner = asyncio.create_task(cache.get_or_generate("key", stalled))
+        await started.wait()
+        waiters = [asyncio.create_task(cache.get_or_generate("key", generate)) for _ in range(2)]
+        await asyncio.sleep(0)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(main())
+    assert sorted(results) == [("print(2)", "generated"), ("print(2)", "shared")]
+    assert cache.stats()["inflight"] == 0
+
+
+def test_generation_errors_reach_waiters(cache):
+    async def main():
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("LLM error")
+
+        return await asyncio.gather(*(cache.get_or_generate("key", failing) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_normalize_task_keeps_case_of_paths_and_quoted_literals():
+    from code_cache import normalize_task
+    assert normalize_task("Write  OK\nto /data/Report.txt") == "write ok to /data/Report.txt"
+    assert normalize_task("Total sales of the “Gold” ticket TYPE in /data/Sales.db") == \
+        "total sales of the “Gold” ticket type in /data/Sales.db"
+    assert normalize_task("Extract the Sender's email") == "extract the sender's email"
+    assert CodeCache.key("Write ok to /data/Report.txt", "v1") != CodeCache.key("Write ok to /data/report.txt", "v1")
+    assert CodeCache.key("WRITE ok to /data/report.txt", "v1") == CodeCache.key("write OK to /data/report.txt", "v1")
+
+
+def test_delete_removes_entry_from_both_tiers(cache, tmp_path):
+    cache.put("key", "task", "print(1)")
+    cache.delete("key")
+    assert cache.get("key") == (None, None)
+    reopened = CodeCache(str(tmp_path / "code_cache.sqlite3"))
+    assert reopened.get("key") == (None, None)
+    assert cache.stats()["deletes"] == 1
@@ -0,0 +1,91 @@
+import asyncio
+import subprocess
+import sys
+
+import httpx
+import pytest
+
+import embeddings
+import handlers
+import http_client
+
+
+def test_import_does_not_load_numpy():
+    code = "import sys, embeddings; print('numpy' in sys.modules)"
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                               cwd=embeddings.__file__.rsplit("/", 1)[0])
+    assert completed.stdout.strip() == "False"
+
+
+@pytest.mark.parametrize("llm_url,expected", [
+    ("https://aiproxy.sanand.workers.dev/openai/v1/chat/completions", "https://aiproxy.sanand.workers.dev/openai/v1/embeddings"),
+    ("http://127.0.0.1:8101/v1/chat/completions/", "http://127.0.0.1:8101/v1/embeddings"),
+    ("http://127.0.0.1:8101/generate", None),
+])
+def test_embeddings_url_follows_llm_url(monkeypatch, llm_url, expected):
+    monkeypatch.setattr(embeddings, "LLM_URL", llm_url)
+    assert embeddings.openai_embeddings_url() == expected
+    monkeypatch.setattr(embeddings, "OPENAI_EMBEDDINGS_URL", "http://embeddings.local/v1/embeddings")
+    assert embeddings.openai_embeddings_url() == "http://embeddings.local/v1/embeddings"
+
+
+def test_similar_pair_declines_without_an_embeddings_endpoint(monkeypatch):
+    task = "Using embeddings, find the most similar pair of comments in /data/comments.txt and write them to /data/out.txt"
+    monkeypatch.delenv("EMBEDDER", raising=False)
+    monkeypatch.setenv("AIPROXY_TOKEN", "token")
+    monkeypatch.setattr(embeddings, "LLM_URL", "http://127.0.0.1:8101/generate")
+    assert handlers.parse_similar_pair(task) is None
+    monkeypatch.setattr(embeddings, "LLM_URL", "http://127.0.0.1:8101/v1/chat/completions")
+    assert handlers.parse_similar_pair(task)["embedder"] == "openai"
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """Route http_client through a mock transport that embeds "a..." and "b..." texts along different axes."""
+    calls = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        texts = httpx.Response(200, content=request.content).json()["input"]
+        data = [{"index": i, "embedding": [1.0, 0.0] if text.startswith("a") else [0.0, 1.0]} for i, text in enumerate(texts)]
+        return httpx.Response(200, json={"data": data})
+
+    get_client = http_client.get_client
+
+    def mock_client():
+        client = get_client()
+        client._transport = httpx.MockTransport(handle)
+        return client
+
+    monkeypatch.setattr(http_client, "get_client", mock_client)
+    monkeypatch.setattr(embeddings, "LLM_URL", "http://llm.local/v1/chat/completions")
+    return calls
+
+
+def test_openai_embedder_without_an_event_loop(fake_upstream):
+    vectors = embeddings.OpenAIEmbedder().embed(["apple", "banana"])
+    assert vectors.tolist() == [[1.0, 0.0], [0.0, 1.0]]
+    assert str(fake_upstream[0].url) == "http://llm.local/v1/embeddings"
+
+
+def test_openai_embedder_from_a_thread_uses_the_app_client(fake_upstream):
+    async def main():
+        client = http_client.get_client()
+        try:
+            vectors = await asyncio.to_thread(embeddings.OpenAIEmbedder().embed, ["apple"])
+            assert http_client.get_client() is client
+            return vectors
+        finally:
+            await http_client.close()
+
+    vectors = asyncio.run(main())
+    assert vectors.tolist() == [[1.0, 0.0]]
+    assert len(fake_upstream) == 1
+
+
+def test_request_sync_refuses_to_block_the_loop():
+    async def main():
+        with pytest.raises(RuntimeError):
+            http_client.request_sync("GET", "http://llm.local/")
+
+    asyncio.run(main())
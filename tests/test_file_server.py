@@ -0,0 +1,101 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+import file_server
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-4", (0, 4)),
+    ("bytes=5-", (5, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=5-2", None),
+    ("bytes=0-1,5-6", None),
+    ("bytes=a-b", None),
+    ("bytes=-0", None),
+    ("items=0-4", None),
+])
+def test_parse_range(header, expected):
+    assert file_server.parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        file_server.parse_range(header, 100)
+
+
+@pytest.mark.parametrize("accept_encoding,expected", [
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("*, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_negotiate_encoding(monkeypatch, accept_encoding, expected):
+    monkeypatch.setattr(file_server, "brotli", None)
+    assert file_server.negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_prefers_brotli(monkeypatch):
+    monkeypatch.setattr(file_server, "brotli", object())
+    assert file_server.negotiate_encoding("gzip, br") == "br"
+    assert file_server.negotiate_encoding("gzip, br;q=0") == "gzip"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_server, "brotli", None)
+    path = tmp_path / "notes.txt"
+    path.write_text("0123456789" * 200)
+    app = FastAPI()
+
+    @app.get("/file")
+    async def get_file(request: Request):
+        return file_server.file_response(request, str(path))
+
+    return TestClient(app)
+
+
+def get(client, **headers):
+    return client.get("/file", headers={"Accept-Encoding": "identity", **headers})
+
+
+@pytest.mark.parametrize("headers", [{"Range": "bytes=5-2"}, {"Range": "bytes=0-1,5-6"},
+                                     {"Range": "bytes=0-4", "If-Range": '"stale"'}])
+def test_ignored_range_serves_the_whole_file(client, headers):
+    response = get(client, **headers)
+    assert response.status_code == 200
+    assert len(response.content) == 2000
+
+
+def test_range(client):
+    response = get(client, Range="bytes=10-14")
+    assert response.status_code == 206
+    assert response.content == b"01234"
+    assert response.headers["content-range"] == "bytes 10-14/2000"
+    assert get(client, Range="bytes=2000-").status_code == 416
+
+
+def test_not_modified(client):
+    response = get(client)
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    assert get(client, **{"If-None-Match": etag}).status_code == 304
+    assert get(client, **{"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert get(client, **{"If-None-Match": '"other"'}).status_code == 200
+    assert get(client, **{"If-Modified-Since": last_modified}).status_code == 304
+
+
+def test_each_encoding_has_its_own_etag(client):
+    identity = get(client)
+    compressed = get(client, **{"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.content == identity.content  # decoded by the client
+    assert compressed.headers["etag"] != identity.headers["etag"]
+    # A cached gzip body does not validate an identity request, and vice versa.
+    assert get(client, **{"If-None-Match": compressed.headers["etag"]}).status_code == 200
+    assert get(client, **{"Accept-Encoding": "gzip", "If-None-Match": identity.headers["etag"]}).status_code == 200
+    assert get(client, **{"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]}).status_code == 304
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import handlers
+import media
+
+# (task as the evaluation phrases it, handler it must route to, parameters it must extract)
+CANONICAL = [
+    (
+        "The file /data/dates.txt contains a list of dates, one per line. Count the number of Wednesdays in the list, "
+        "and write just the number to /data/dates-wednesdays.txt",
+        "count_weekday", {"weekday": "wednesday", "source": "/data/dates.txt", "output": "/data/dates-wednesdays.txt"},
+    ),
+    (
+        "/data/email.txt contains an email message. Pass the content to an LLM with instructions to extract the "
+        "sender's email address, and write just the email address to /data/email-sender.txt",
+        "email_sender", {"source": "/data/email.txt", "output": "/data/email-sender.txt"},
+    ),
+    (
+        "Write the first line of the 10 most recent .log file in /data/logs/ to /data/logs-recent.txt, most recent first",
+        "recent_logs", {"count": 10, "directory": "/data/logs/", "output": "/data/logs-recent.txt"},
+    ),
+    (
+        "Find all Markdown (.md) files in /data/docs/. For each file, extract the first occurrance of each H1 "
+        "(i.e. a line starting with # ). Create an index file /data/docs/index.json that maps each filename "
+        "(without the /data/docs/ prefix) to its title",
+        "markdown_index", {"directory": "/data/docs/", "output": "/data/docs/index.json"},
+    ),
+    (
+        "The SQLite database file /data/ticket-sales.db has a tickets with columns type, units, and price. Each row "
+        "is a customer bid for a concrete ticket type. What is the total sales of all the items in the “Gold” ticket "
+        "type? Write the number in /data/ticket-sales-gold.txt",
+        "ticket_sales", {"database": "/data/ticket-sales.db", "table": "tickets", "ticket_type": "Gold",
+                         "output": "/data/ticket-sales-gold.txt"},
+    ),
+    (
+        "Format the contents of /data/format.md using prettier@3.4.2, updating the file in-place",
+        "prettier", {"path": "/data/format.md", "version": "3.4.2"},
+    ),
+    (
+        "/data/comments.txt contains a list of comments, one per line. Using embeddings, find the most similar pair "
+        "of comments and write them to /data/comments-similar.txt, one per line",
+        "similar_pair", {"source": "/data/comments.txt", "output": "/data/comments-similar.txt", "embedder": "hashing"},
+    ),
+    (
+        "Transcribe the audio from /data/interview.mp3 and write the text to /data/interview.txt",
+        "transcribe_audio", {"source": "/data/interview.mp3", "output": "/data/interview.txt"},
+    ),
+    (
+        "Resize /data/photo.jpg to 800x600 and save it as /data/photo-small.jpg",
+        "resize_image", {"source": "/data/photo.jpg", "output": "/data/photo-small.jpg", "width": 800, "height": 600},
+    ),
+    (
+        "Compress the image /data/logo.png losslessly and save it to /data/logo-small.png",
+        "resize_image", {"source": "/data/logo.png", "output": "/data/logo-small.png"},
+    ),
+]
+
+# Wordings close to a handled family that no handler may take (they go to the LLM).
+NEAR_MISSES = [
+    # count_weekday: no weekday, or nowhere to write the count
+    "Count the number of lines in /data/dates.txt and write just the number to /data/dates-count.txt",
+    "Count the number of Wednesdays in /data/dates.txt",
+    # email_sender: the recipient, not the sender
+    "/data/email.txt contains an email message. Extract the recipient's email address and write it to /data/email-to.txt",
+    # recent_logs: last lines rather than first lines
+    "Write the last line of the 10 most recent .log file in /data/logs/ to /data/logs-recent.txt",
+    # markdown_index: no H1/title, or not written as JSON
+    "Find all Markdown (.md) files in /data/docs/ and write how many there are to /data/docs-count.txt",
+    "Extract the H1 of every Markdown file in /data/docs/ and write them to /data/docs/index.txt",
+    # ticket_sales: no quoted ticket type, or not total sales
+    "The SQLite database file /data/ticket-sales.db has a tickets table. What is the total sales? Write it in /data/sales.txt",
+    "The SQLite database file /data/ticket-sales.db has a tickets table. How many units of the “Gold” ticket type "
+    "were sold? Write the number in /data/gold-units.txt",
+    # prettier: more than one file, or another formatter
+    "Format /data/a.md and /data/b.md with prettier",
+    "Format the contents of /data/format.py using black, updating the file in-place",
+    # similar_pair: the most similar line to a given one, not a pair
+    "Find the comment in /data/comments.txt most similar to the first one and write it to /data/comments-similar.txt",
+    # transcribe_audio: not an audio file, or a conversion
+    "Transcribe the notes in /data/notes.txt into /data/notes-clean.txt",
+    "Convert /data/interview.mp3 to /data/interview.wav",
+    # resize_image: lossless into a lossy format, or no destination
+    "Compress the image /data/logo.png losslessly and save it to /data/logo-small.jpg",
+    "Resize /data/photo.jpg to 800x600",
+]
+
+
+@pytest.fixture(autouse=True)
+def backends(monkeypatch):
+    monkeypatch.setenv("EMBEDDER", "hashing")
+    monkeypatch.setattr(media, "transcription_available", lambda name=None: True)
+
+
+@pytest.mark.parametrize("task,name,params", CANONICAL, ids=[name for _, name, _ in CANONICAL])
+def test_canonical_task_routes_to_handler(task, name, params):
+    matched = handlers.match(task)
+    assert matched is not None
+    assert (matched[0], matched[2]) == (name, params)
+
+
+@pytest.mark.parametrize("task", NEAR_MISSES)
+def test_near_miss_is_left_to_the_llm(task):
+    assert handlers.match(task) is None
+
+
+def test_similar_pair_needs_a_semantic_embedder(monkeypatch):
+    task = CANONICAL[6][0]
+    monkeypatch.delenv("EMBEDDER")
+    monkeypatch.delenv("AIPROXY_TOKEN", raising=False)
+    assert handlers.parse_similar_pair(task) is None
+    monkeypatch.setenv("AIPROXY_TOKEN", "token")
+    assert handlers.parse_similar_pair(task)["embedder"] == "openai"
+
+
+def test_transcribe_audio_needs_a_backend(monkeypatch, tmp_path):
+    task = CANONICAL[7][0]
+    monkeypatch.undo()
+    monkeypatch.setenv("PATH", str(tmp_path))
+    assert handlers.parse_transcribe_audio(task) is None
+    for tool in ("ffmpeg", "ffprobe"):
+        (tmp_path / tool).write_text("#!/bin/sh\n")
+        (tmp_path / tool).chmod(0o755)
+    monkeypatch.setattr(media, "TRANSCRIBER", "google")
+    monkeypatch.setattr(media.importlib.util, "find_spec", lambda name: object() if name == "speech_recognition" else None)
+    assert handlers.parse_transcribe_audio(task) == {"source": "/data/interview.mp3", "output": "/data/interview.txt"}
+
+
+def run_task(task: str) -> dict:
+    _, run, params = handlers.match(task)
+    return asyncio.run(handlers.run(run, params))
+
+
+def test_count_weekday_mixed_date_formats(data_dir):
+    (data_dir / "dates.txt").write_text(
+        "2023-01-04\n2023/01/11 10:00:00\n18-Jan-2023\nJan 25, 2023\n08 Feb 2023\nFebruary 15, 2023\n"
+        "2023-01-05\n2023/01/07\n\n"
+    )
+    run_task(CANONICAL[0][0])
+    assert (data_dir / "dates-wednesdays.txt").read_text() == "6"
+
+
+def test_count_weekday_unknown_format_fails(data_dir):
+    (data_dir / "dates.txt").write_text("2023-01-04\nthe fourth of January\n")
+    with pytest.raises(handlers.HandlerError):
+        run_task(CANONICAL[0][0])
+    assert not (data_dir / "dates-wednesdays.txt").exists()
+
+
+@pytest.mark.parametrize("sender", ['"Doe, Jane" <jane.doe@example.com>', "Jane Doe <jane.doe@example.com>",
+                                    "jane.doe@example.com"])
+def test_email_sender(data_dir, sender):
+    (data_dir / "email.txt").write_text(
+        f"Subject: Meeting\nFrom: {sender}\nTo: Bob <bob@example.com>\n\nSee you at 10, bob@example.com.\n"
+    )
+    run_task(CANONICAL[1][0])
+    assert (data_dir / "email-sender.txt").read_text() == "jane.doe@example.com"
+
+
+def test_recent_logs(data_dir):
+    logs = data_dir / "logs"
+    (logs / "old").mkdir(parents=True)
+    for n in range(12):
+        path = logs / f"log-{n}.log"
+        path.write_text(f"first line of {n}\nsecond line\n")
+        os.utime(path, (1_700_000_000 + n, 1_700_000_000 + n))
+    # Newer, but not a .log file directly in the directory.
+    for path in (logs / "notes.txt", logs / "old" / "nested.log"):
+        path.write_text("ignored\n")
+        os.utime(path, (1_800_000_000, 1_800_000_000))
+    run_task(CANONICAL[2][0])
+    expected = [f"first line of {n}" for n in range(11, 1, -1)]
+    assert (data_dir / "logs-recent.txt").read_text().splitlines() == expected
+
+
+def test_markdown_index_nested_docs(data_dir):
+    docs = data_dir / "docs"
+    (docs / "guide" / "advanced").mkdir(parents=True)
+    (docs / "README.md").write_text("# Home\n\nWelcome.\n# Second H1\n")
+    (docs / "guide" / "intro.md").write_text("Preamble\n\n## Not an H1\n# Getting Started\n")
+    (docs / "guide" / "advanced" / "llm.md").write_text("#Not a heading either\n# Large Language Models\n")
+    (docs / "guide" / "empty.md").write_text("No headings here.\n")
+    (docs / "notes.txt").write_text("# Not Markdown\n")
+    run_task(CANONICAL[3][0])
+    assert json.loads((docs / "index.json").read_text()) == {
+        "README.md": "Home",
+        "guide/intro.md": "Getting Started",
+        "guide/advanced/llm.md": "Large Language Models",
+    }
+
+
+def test_ticket_sales(data_dir):
+    connection = sqlite3.connect(data_dir / "ticket-sales.db")
+    connection.execute("CREATE TABLE tickets (type TEXT, units INTEGER, price REAL)")
+    connection.executemany("INSERT INTO tickets VALUES (?, ?, ?)",
+                           [("Gold", 2, 10.5), ("gold", 100, 1.0), ("Silver", 3, 4.0), ("Gold", 1, 9.0)])
+    connection.commit()
+    connection.close()
+    run_task(CANONICAL[4][0])
+    assert float((data_dir / "ticket-sales-gold.txt").read_text()) == 30.0
+
+
+@pytest.mark.skipif(shutil.which("prettier") is None, reason="prettier is not installed")
+def test_prettier(data_dir):
+    (data_dir / "format.md").write_text("#  Title\n\n* item one\n*   item two\n")
+    _, run, params = handlers.match("Format the contents of /data/format.md using prettier, updating the file in-place")
+    asyncio.run(handlers.run(run, params))
+    assert (data_dir / "format.md").read_text() == "# Title\n\n- item one\n- item two\n"
+
+
+def test_similar_pair(data_dir):
+    pytest.importorskip("sklearn")
+    (data_dir / "comments.txt").write_text(
+        "The delivery was late again\nI love this product so much\nPrices went up this month\n"
+        "I really love this product\n\nThe app keeps crashing\n"
+    )
+    run_task(CANONICAL[6][0])
+    assert (data_dir / "comments-similar.txt").read_text() == "I love this product so much\nI really love this product\n"
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_transcribe_audio(data_dir):
+    try:
+        media.get_transcriber()
+    except media.MediaUnavailable as e:
+        pytest.skip(str(e))
+    import subprocess
+    subprocess.run(["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono", "-t", "2",
+                    str(data_dir / "interview.mp3")], check=True)
+    try:
+        run_task(CANONICAL[7][0])
+    finally:
+        media.shutdown()
+    assert (data_dir / "interview.txt").exists()
+
+
+def test_resize_image(data_dir):
+    Image = pytest.importorskip("PIL.Image")
+    Image.new("RGB", (1600, 1200), (200, 30, 30)).save(data_dir / "photo.jpg", quality=95)
+    try:
+        run_task(CANONICAL[8][0])
+    finally:
+        media.shutdown()
+    with Image.open(data_dir / "photo-small.jpg") as image:
+        assert image.size == (800, 600)
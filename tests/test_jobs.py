@@ -0,0 +1,147 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+class Failed(Exception):
+    status_code = 422
+    detail = "Bad task."
+
+
+async def runner(task: str, report) -> dict:
+    report("working")
+    await asyncio.sleep(0)
+    if task == "fail":
+        raise Failed()
+    return {"echo": task}
+
+
+def scheduler(db_path=None, workers: int = 1, depth: int = 10) -> jobs.JobScheduler:
+    return jobs.JobScheduler(runner, workers={"llm": workers}, max_depth={"llm": depth},
+                             db_path=str(db_path) if db_path else None)
+
+
+async def finish(scheduler: jobs.JobScheduler, job_id: str) -> dict:
+    async def last_state():
+        async for state in scheduler.watch(job_id):
+            pass
+        return state
+
+    return await asyncio.wait_for(last_state(), 5)
+
+
+def test_jobs_succeed_and_fail():
+    async def main():
+        s = scheduler()
+        await s.start()
+        ok, bad = s.submit("hello", "llm"), s.submit("fail", "llm")
+        results = await finish(s, ok.id), await finish(s, bad.id)
+        await s.stop()
+        return results
+
+    ok, bad = asyncio.run(main())
+    assert (ok["status"], ok["stage"], ok["result"], ok["status_code"]) == ("succeeded", "done", {"echo": "hello"}, 200)
+    assert (bad["status"], bad["error"], bad["status_code"]) == ("failed", "Bad task.", 422)
+
+
+def test_queue_depth_is_bounded():
+    async def main():
+        s = scheduler(workers=0, depth=1)
+        await s.start()
+        s.submit("a", "llm")
+        with pytest.raises(jobs.QueueFull):
+            s.submit("b", "llm")
+        await s.stop()
+
+    asyncio.run(main())
+
+
+def test_finished_jobs_survive_a_restart(tmp_path):
+    db_path = tmp_path / "jobs.sqlite3"
+
+    async def first_run():
+        s = scheduler(db_path)
+        await s.start()
+        done = s.submit("hello", "llm")
+        await finish(s, done.id)
+        await s.stop()
+        # Not started by a worker yet: requeued on the next start.
+        s = scheduler(db_path, workers=0)
+        await s.start()
+        pending = s.submit("later", "llm")
+        await s.stop()
+        return done.id, pending.id
+
+    async def second_run(done_id, pending_id):
+        s = scheduler(db_path)
+        await s.start()
+        done = s.get(done_id).to_dict()
+        pending = await finish(s, pending_id)
+        await s.stop()
+        return done, pending
+
+    done_id, pending_id = asyncio.run(first_run())
+    done, pending = asyncio.run(second_run(done_id, pending_id))
+    assert (done["status"], done["result"]) == ("succeeded", {"echo": "hello"})
+    assert (pending["status"], pending["result"]) == ("succeeded", {"echo": "later"})
+
+
+def test_jobs_past_retention_are_dropped_on_start(tmp_path, monkeypatch):
+    db_path = tmp_path / "jobs.sqlite3"
+
+    async def run(submit: bool):
+        s = scheduler(db_path)
+        await s.start()
+        job = s.submit("hello", "llm") if submit else None
+        if job:
+            await finish(s, job.id)
+        await s.stop()
+        return s, job
+
+    _, job = asyncio.run(run(True))
+    monkeypatch.setattr(jobs, "JOB_RETENTION", 0)
+    time.sleep(0.01)
+    s, _ = asyncio.run(run(False))
+    assert s.get(job.id) is None
+    assert sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_database_writes_happen_off_the_event_loop(tmp_path, monkeypatch):
+    threads = set()
+    original = jobs.JobScheduler._write_loop
+
+    def write_loop(self):
+        threads.add(threading.current_thread().name)
+        original(self)
+
+    monkeypatch.setattr(jobs.JobScheduler, "_write_loop", write_loop)
+
+    async def main():
+        s = scheduler(tmp_path / "jobs.sqlite3")
+        await s.start()
+        s._db = Unusable(s._db)
+        job = s.submit("hello", "llm")
+        await finish(s, job.id)
+        await s.stop()
+        return job.id
+
+    class Unusable:
+        """The connection, refusing to be used from the event loop's thread."""
+
+        def __init__(self, connection):
+            self.connection = connection
+            self.loop_thread = threading.get_ident()
+
+        def __getattr__(self, name):
+            assert threading.get_ident() != self.loop_thread, f"{name} called on the event loop"
+            return getattr(self.connection, name)
+
+    job_id = asyncio.run(main())
+    assert threads == {"jobs-db"}
+    row = sqlite3.connect(tmp_path / "jobs.sqlite3").execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row == ("succeeded",)
@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+import query_engine
+
+
+def _make_db(path, table, rows):
+    connection = sqlite3.connect(path)
+    connection.execute(f"CREATE TABLE {table} (type TEXT, units INTEGER, price REAL)")
+    connection.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+def test_query_reads_database(data_dir):
+    _make_db(data_dir / "tickets.db", "tickets", [("Gold", 2, 10.0), ("Silver", 1, 5.0)])
+    assert query_engine.scalar("/data/tickets.db", "SELECT SUM(units * price) FROM tickets WHERE type = ?", ("Gold",)) == 20.0
+
+
+def test_writes_are_rejected(data_dir):
+    _make_db(data_dir / "tickets.db", "tickets", [])
+    with pytest.raises(query_engine.QueryError):
+        query_engine.query("/data/tickets.db", "INSERT INTO tickets VALUES ('Gold', 1, 1)")
+
+
+def test_attach_is_rejected(data_dir, tmp_path):
+    _make_db(data_dir / "tickets.db", "tickets", [])
+    _make_db(tmp_path / "secret.db", "secret", [("hidden", 1, 1.0)])
+    with pytest.raises(query_engine.QueryError):
+        query_engine.query("/data/tickets.db", f"ATTACH DATABASE '{tmp_path / 'secret.db'}' AS s")
+    # Nothing stays attached to the pooled connection either.
+    with pytest.raises(query_engine.QueryError):
+        query_engine.query("/data/tickets.db", "SELECT * FROM s.secret")
+
+
+def test_paths_outside_data_are_refused(data_dir, tmp_path):
+    _make_db(tmp_path / "secret.db", "secret", [])
+    with pytest.raises(ValueError):
+        query_engine.query("/data/../secret.db", "SELECT 1")
@@ -0,0 +1,55 @@
+import json
+import os
+
+import pytest
+
+import data_index
+
+
+@pytest.fixture
+def client(data_dir, monkeypatch):
+    monkeypatch.setenv("AIPROXY_TOKEN", "test")
+    from fastapi.testclient import TestClient
+    import app
+    # Without the lifespan, so no live index: globs read the snapshot index and rescan.
+    return TestClient(app.app)
+
+
+def bulk(client, **params) -> dict:
+    response = client.get("/read/bulk", params=params)
+    assert response.status_code == 200
+    return {entry["path"]: entry for entry in map(json.loads, response.text.splitlines())}
+
+
+def test_read_and_bulk_resolve_paths_alike(client, data_dir):
+    (data_dir / "out").mkdir()
+    (data_dir / "out" / "a.json").write_text("nested")
+    (data_dir / "a.json").write_text("top level")
+    for path, content in (("/data/out/a.json", "nested"), ("/data/a.json", "top level")):
+        assert client.get("/read", params={"path": path}).text == content
+        assert bulk(client, path=path)[path]["content"] == content
+
+
+def test_read_and_bulk_refuse_paths_outside_data(client, data_dir, tmp_path):
+    (tmp_path / "secret.txt").write_text("secret")
+    os.symlink(tmp_path / "secret.txt", data_dir / "link.txt")
+    for path in ("/data/link.txt", "/data/../secret.txt", "/data/missing.txt"):
+        assert client.get("/read", params={"path": path}).status_code == 404
+        assert "error" in bulk(client, path=path)[path]
+
+
+def test_glob_rescans_only_its_directory(client, data_dir, monkeypatch):
+    (data_dir / "out").mkdir()
+    (data_dir / "out" / "a.json").write_text("{}")
+    (data_dir / "b.json").write_text("{}")
+    scanned = []
+    scan = data_index.DataIndex.scan
+    monkeypatch.setattr(data_index.DataIndex, "scan", lambda self, prefix="": scanned.append(prefix) or scan(self, prefix))
+    assert list(bulk(client, glob="/data/out/*.json")) == ["/data/out/a.json"]
+    assert scanned == ["out"]
+    assert sorted(bulk(client, glob="*.json")) == ["/data/b.json", "/data/out/a.json"]
+    assert scanned == ["out", ""]
+
+
+def test_glob_outside_data_is_refused(client):
+    assert client.get("/read/bulk", params={"glob": "/data/../*.txt"}).status_code == 400